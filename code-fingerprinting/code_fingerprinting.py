@@ -0,0 +1,155 @@
+import hashlib
+import ast
+from ast import AST
+from typing import Dict, Iterator, List
+
+
+class PythonFingerprinter(ast.NodeVisitor):
+    def __init__(self):
+        # A list to store the normalized version of the script
+        self.normalized_script = []
+
+    def visit_Constant(self, node):
+        # Since Python 3.8, all literals are `ast.Constant` nodes (`visit_Str` & `visit_Num` are never called)
+        self.normalized_script.append(literal_token(node))
+
+    # To handle complex use cases, define additional visit_ methods for other types of AST nodes. Ex - visit_ListComp(self, node), visit_Assign(self, node), visit_If(self, node), etc
+
+    def generic_visit(self, node):
+        self.normalized_script.append(node.__class__.__name__)
+        super().generic_visit(node)
+
+
+def literal_token(node: ast.Constant) -> str:
+    if isinstance(node.value, str):
+        # Replace all string literals (eg; "hello", 'world', etc) with a single token
+        return "STRING_LITERAL"
+    if isinstance(node.value, (int, float, complex)) and not isinstance(node.value, bool):
+        # Replace all number literals (eg; 1, 500, 5.5, etc) with a single token
+        return "NUMBER_LITERAL"
+    # True, False, None, bytes & Ellipsis
+    return node.__class__.__name__
+
+
+# Tokens are encoded once per node type, instead of once per node
+_TOKENS: Dict[type, bytes] = {}
+_STRING_LITERAL = b"STRING_LITERAL"
+_NUMBER_LITERAL = b"NUMBER_LITERAL"
+
+
+def node_token(node: ast.AST) -> bytes:
+    """The normalized token of a single node (same as `PythonFingerprinter`), encoded as bytes."""
+    node_type = type(node)
+    if node_type is ast.Constant:
+        value = node.value
+        if isinstance(value, str):
+            return _STRING_LITERAL
+        if isinstance(value, (int, float, complex)) and not isinstance(value, bool):
+            return _NUMBER_LITERAL
+    token = _TOKENS.get(node_type)
+    if token is None:
+        token = _TOKENS[node_type] = node_type.__name__.encode()
+    return token
+
+
+def child_nodes(node: ast.AST) -> List[ast.AST]:
+    """Direct children of the node, in the same order as `ast.iter_child_nodes`."""
+    children = []
+    for field in node._fields:
+        child = getattr(node, field, None)
+        if isinstance(child, list):
+            children.extend(item for item in child if isinstance(item, AST))
+        elif isinstance(child, AST):
+            children.append(child)
+    return children
+
+
+def iter_normalized_tokens(tree: ast.AST) -> Iterator[bytes]:
+    """
+    Yield the same tokens as `PythonFingerprinter` (encoded as bytes), in the same (pre-)order.
+
+    Walks the tree with an explicit stack instead of recursion, so deeply nested code can't hit the recursion limit.
+    """
+    stack = [tree]
+    pop, extend = stack.pop, stack.extend
+    while stack:
+        node = pop()
+        yield node_token(node)
+        # push the children in reverse, so they are popped in order
+        extend(reversed(child_nodes(node)))
+
+
+def normalize_python_script(script):
+    """Parse the script and produce a normalized version using AST."""
+    tree = ast.parse(script)
+    visitor = PythonFingerprinter()
+    visitor.visit(tree)
+    return "".join(visitor.normalized_script)
+
+
+def fingerprint_tree(tree, hash_factory=hashlib.md5, chunk_size=64 * 1024):
+    """
+    Compute the fingerprint of a parsed script.
+
+    The normalized tokens are fed into an incremental hash object during the walk (in chunks of `chunk_size` bytes)
+    instead of building the whole normalized script first. The fingerprint is the same as hashing
+    `normalize_python_script(script)`.
+    """
+    hasher = hash_factory()
+    buffer = bytearray()
+    for token in iter_normalized_tokens(tree):
+        buffer += token
+        if len(buffer) >= chunk_size:
+            hasher.update(buffer)
+            buffer.clear()
+    hasher.update(buffer)
+    return hasher.hexdigest()
+
+
+def compute_fingerprint(script):
+    """Compute a fingerprint for the python script."""
+    return fingerprint_tree(ast.parse(script))
+
+
+def detect_duplicate_script(script, stored_fingerprints):
+    """
+    Detect whether the script is a duplicate.
+
+    :param stored_fingerprints: a set, or a `FingerprintStore` (fingerprint_store.py) to persist them across restarts
+    """
+    fingerprint = compute_fingerprint(script)
+    if fingerprint in stored_fingerprints:
+        return True
+    stored_fingerprints.add(fingerprint)
+    return False
+
+
+if __name__ == "__main__":
+    # Testing
+    stored_fingerprints = set()
+
+    script1 = """
+def xyz(a, b):
+    return a + b - c
+"""
+
+    script2 = """
+def xyz(x, y):
+    return x + y - z
+"""
+
+    script3 = """
+def xyz(a, b):
+    return a - b + c
+"""
+
+    script4 = """
+def xyz(a, b):
+    return 1 - 2 + 3
+"""
+
+    for script in [script1, script2, script3, script4]:
+        print(normalize_python_script(script))
+        print(compute_fingerprint(script), end="\n\n")
+
+    print([detect_duplicate_script(script, stored_fingerprints) for script in [script1, script2, script3, script4]])
@@ -0,0 +1,183 @@
+"""
+Fingerprint every Python file under a directory, in parallel & incrementally.
+
+1. Files are fingerprinted across a `ProcessPoolExecutor` (parsing is CPU bound, so threads wouldn't help).
+2. Results are cached in SQLite, keyed by the file path & validated by (mtime, size, content hash):
+   1. If the mtime & size didn't change, the cached fingerprint is used without even reading the file.
+   2. If they changed but the content hash didn't (eg - the file was touched or checked out again), the file is read &
+      hashed, but not parsed again.
+   3. Otherwise, the file is parsed & fingerprinted.
+3. Files under the directory which no longer exist are removed from the cache. Paths are stored as absolute paths, so
+   a single cache can be shared by several directories.
+
+    python fingerprint_corpus.py <directory> [--cache fingerprints.db] [--workers 8]
+"""
+
+import argparse
+import ast
+import hashlib
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from code_fingerprinting import fingerprint_tree
+
+# (path, mtime_ns, size, content hash, fingerprint). Fingerprint is None for files which don't parse.
+Entry = Tuple[str, int, int, bytes, Optional[str]]
+
+
+class FingerprintCache:
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path)
+        # WAL lets readers (eg - the dedup service) read the cache while it is being updated
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                content_hash BLOB NOT NULL,
+                fingerprint TEXT
+            )
+            """
+        )
+
+    def load(self) -> Dict[str, Entry]:
+        return {row[0]: row for row in self.conn.execute("SELECT * FROM files")}
+
+    def save(self, entries: List[Entry]) -> None:
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)", entries)
+
+    def delete(self, paths: List[str]) -> None:
+        with self.conn:
+            self.conn.executemany("DELETE FROM files WHERE path = ?", [(path,) for path in paths])
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+def walk_python_files(root: str) -> Iterator[Tuple[str, int, int]]:
+    """Yield (path, mtime_ns, size) of every `.py` file under root. `os.scandir` reuses the stat from the listing."""
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.endswith(".py") and entry.is_file(follow_symlinks=False):
+                    stat = entry.stat(follow_symlinks=False)
+                    yield entry.path, stat.st_mtime_ns, stat.st_size
+
+
+def fingerprint_file(task: Tuple[str, int, int, Optional[bytes], Optional[str]]) -> Tuple[Optional[Entry], bool]:
+    """
+    Runs in a worker process. Returns the cache entry & whether the file had to be parsed. The entry is None if the
+    file couldn't be read (eg - it was removed after the directory was listed).
+
+    :param task: (path, mtime_ns, size, cached content hash, cached fingerprint)
+    """
+    path, mtime_ns, size, cached_hash, cached_fingerprint = task
+    try:
+        with open(path, "rb") as f:
+            source = f.read()
+    except OSError:
+        return None, False
+    content_hash = hashlib.blake2b(source, digest_size=16).digest()
+    if content_hash == cached_hash:
+        return (path, mtime_ns, size, content_hash, cached_fingerprint), False
+
+    try:
+        fingerprint = fingerprint_tree(ast.parse(source))
+    except (SyntaxError, ValueError, RecursionError):
+        fingerprint = None
+    return (path, mtime_ns, size, content_hash, fingerprint), True
+
+
+@dataclass
+class CorpusStats:
+    files: int = 0
+    unchanged: int = 0  # mtime & size matched the cache
+    rehashed: int = 0  # read & hashed, but the content hadn't changed
+    parsed: int = 0
+    failed: int = 0  # couldn't be read or didn't parse
+    removed: int = 0  # no longer on disk
+    elapsed: float = 0.0
+
+
+def fingerprint_corpus(
+    root: str, cache_path: str, workers: Optional[int] = None, batch_size: int = 1000
+) -> Tuple[Dict[str, Optional[str]], CorpusStats]:
+    """Fingerprint every Python file under root. Returns {path: fingerprint} & stats about the run."""
+    start = time.perf_counter()
+    stats = CorpusStats()
+    cache = FingerprintCache(cache_path)
+    root = os.path.abspath(root)
+    # only the cached files under root can have been removed, the others belong to other directories
+    prefix = os.path.join(root, "")
+    cached = {path: entry for path, entry in cache.load().items() if path.startswith(prefix)}
+
+    fingerprints: Dict[str, Optional[str]] = {}
+    tasks = []
+    for path, mtime_ns, size in walk_python_files(root):
+        stats.files += 1
+        entry = cached.pop(path, None)
+        if entry is not None and entry[1] == mtime_ns and entry[2] == size:
+            fingerprints[path] = entry[4]
+            stats.unchanged += 1
+        else:
+            cached_hash, cached_fingerprint = (entry[3], entry[4]) if entry is not None else (None, None)
+            tasks.append((path, mtime_ns, size, cached_hash, cached_fingerprint))
+
+    # whatever is left in `cached` wasn't found on disk
+    stats.removed = len(cached)
+    cache.delete(list(cached))
+
+    if tasks:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # large chunks amortize the inter-process communication over many small files
+            chunksize = max(1, min(256, len(tasks) // ((workers or os.cpu_count() or 1) * 4)))
+            batch = []
+            results = executor.map(fingerprint_file, tasks, chunksize=chunksize)
+            for task, (entry, parsed) in zip(tasks, results):
+                if entry is None:
+                    # not cached, so the file is read again on the next run
+                    fingerprints[task[0]] = None
+                    stats.failed += 1
+                    continue
+                fingerprints[entry[0]] = entry[4]
+                stats.parsed += parsed
+                stats.rehashed += not parsed
+                stats.failed += parsed and entry[4] is None
+                batch.append(entry)
+                if len(batch) >= batch_size:
+                    cache.save(batch)
+                    batch = []
+            cache.save(batch)
+
+    cache.close()
+    stats.elapsed = time.perf_counter() - start
+    return fingerprints, stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("root", help="directory to fingerprint")
+    parser.add_argument("--cache", default="fingerprints.db", help="SQLite cache file")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: number of CPUs)")
+    args = parser.parse_args()
+
+    fingerprints, stats = fingerprint_corpus(args.root, args.cache, args.workers)
+    parsed = [fingerprint for fingerprint in fingerprints.values() if fingerprint is not None]
+    duplicates = len(parsed) - len(set(parsed))
+    print(
+        f"{stats.files} files in {stats.elapsed:.2f} sec ({stats.files / max(stats.elapsed, 1e-9):,.0f} files/sec). "
+        f"Unchanged: {stats.unchanged}, re-hashed: {stats.rehashed}, parsed: {stats.parsed} "
+        f"(failed: {stats.failed}), removed: {stats.removed}"
+    )
+    print(f"{duplicates} files are duplicates of another file")
@@ -0,0 +1,186 @@
+"""
+A persistent store of fingerprints, to replace the in-memory `stored_fingerprints` set.
+
+A set of hex fingerprints takes over 100 bytes per entry & is lost on restart. This store keeps every fingerprint as its
+16 byte binary (md5) digest, in 2 files:
+1. `<path>` - the sorted digests, memory mapped. Lookups binary search it (`np.searchsorted`), so opening the store
+   doesn't read it & the OS only keeps the pages which are actually used in memory.
+2. `<path>.log` - an append-only log of the digests added since the last merge, also loaded into a set on open. Once it
+   has `merge_threshold` entries, it is merged into the sorted file, chunk by chunk, into a new file which then
+   atomically replaces the old one.
+
+Both take exactly 16 bytes per fingerprint on disk. Only one process should write to a store at a time.
+
+    python fingerprint_store.py [--count 10000000]   # benchmark
+"""
+
+import argparse
+import os
+import sys
+import time
+from typing import Iterable, List, Set, Union
+
+import numpy as np
+
+DIGEST_SIZE = 16
+# fixed length byte strings compare (& sort) like the digests themselves
+DTYPE = np.dtype(f"S{DIGEST_SIZE}")
+
+Fingerprint = Union[str, bytes]
+
+
+def to_digest(fingerprint: Fingerprint) -> bytes:
+    """Fingerprints are accepted both as hex strings (as `compute_fingerprint` returns them) & as binary digests."""
+    return bytes.fromhex(fingerprint) if isinstance(fingerprint, str) else fingerprint
+
+
+class FingerprintStore:
+    def __init__(self, path: str, merge_threshold: int = 1_000_000, chunk_size: int = 1_000_000):
+        self.path = path
+        self.log_path = f"{path}.log"
+        self.merge_threshold = merge_threshold
+        self.chunk_size = chunk_size
+
+        self.sorted = self._map_sorted()
+        self.recent: Set[bytes] = set()
+        valid = 0
+        if os.path.exists(self.log_path):
+            with open(self.log_path, "rb") as f:
+                log = f.read()
+            # a crash in the middle of an append may leave a partial digest at the end
+            valid = len(log) - len(log) % DIGEST_SIZE
+            self.recent = {log[i : i + DIGEST_SIZE] for i in range(0, valid, DIGEST_SIZE)}
+        self.log = open(self.log_path, "ab")
+        self.log.truncate(valid)
+
+    def _map_sorted(self) -> np.ndarray:
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return np.empty(0, dtype=DTYPE)
+        return np.memmap(self.path, dtype=DTYPE, mode="r")
+
+    def __len__(self) -> int:
+        return len(self.sorted) + len(self.recent)
+
+    def _in_sorted(self, digests: np.ndarray) -> np.ndarray:
+        if len(self.sorted) == 0:
+            return np.zeros(len(digests), dtype=bool)
+        positions = np.searchsorted(self.sorted, digests)
+        return self.sorted[np.minimum(positions, len(self.sorted) - 1)] == digests
+
+    def contains_many(self, fingerprints: Iterable[Fingerprint]) -> np.ndarray:
+        """Batch lookup - a boolean array, True for the fingerprints which are in the store."""
+        digests = [to_digest(fingerprint) for fingerprint in fingerprints]
+        found = self._in_sorted(np.array(digests, dtype=DTYPE))
+        if self.recent:
+            found |= np.fromiter((digest in self.recent for digest in digests), dtype=bool, count=len(digests))
+        return found
+
+    def add_many(self, fingerprints: Iterable[Fingerprint]) -> np.ndarray:
+        """
+        Batch insert. Returns a boolean array, True for the fingerprints which were already in the store (including
+        duplicates within the batch), ie - the duplicate scripts.
+        """
+        digests = [to_digest(fingerprint) for fingerprint in fingerprints]
+        found = self.contains_many(digests)
+        new: List[bytes] = []
+        for i, digest in enumerate(digests):
+            if found[i]:
+                continue
+            if digest in self.recent:
+                # seen earlier in this batch
+                found[i] = True
+                continue
+            self.recent.add(digest)
+            new.append(digest)
+
+        if new:
+            # a single write per batch
+            self.log.write(b"".join(new))
+            self.log.flush()
+            if len(self.recent) >= self.merge_threshold:
+                self.merge()
+        return found
+
+    def __contains__(self, fingerprint: Fingerprint) -> bool:
+        return bool(self.contains_many([fingerprint])[0])
+
+    def add(self, fingerprint: Fingerprint) -> None:
+        self.add_many([fingerprint])
+
+    def merge(self) -> None:
+        """Merge the log into the sorted file, without loading the sorted file into memory."""
+        if not self.recent:
+            return
+        new = np.sort(np.array(list(self.recent), dtype=DTYPE))
+        # where each new digest goes in the sorted file
+        positions = np.searchsorted(self.sorted, new)
+
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            for start in range(0, max(len(self.sorted), 1), self.chunk_size):
+                end = start + self.chunk_size
+                # the new digests which go before `sorted[end]` (or at the end, for the last chunk)
+                first, last = np.searchsorted(positions, [start, end])
+                if end >= len(self.sorted):
+                    last = len(new)
+                chunk = np.insert(self.sorted[start:end], positions[first:last] - start, new[first:last])
+                f.write(chunk.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+        # `os.replace` is atomic - readers see either the old or the new file, never a partially merged one
+        del self.sorted
+        os.replace(tmp_path, self.path)
+        self.sorted = self._map_sorted()
+        self.recent.clear()
+        self.log.truncate(0)
+        self.log.seek(0)
+
+    def close(self) -> None:
+        self.log.close()
+
+
+if __name__ == "__main__":
+    import shutil
+    import tempfile
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=10_000_000, help="number of fingerprints to insert")
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "fingerprints.bin")
+    rng = np.random.default_rng(0)
+    store = FingerprintStore(path)
+
+    start = time.perf_counter()
+    for _ in range(args.count // args.batch_size):
+        batch = rng.bytes(args.batch_size * DIGEST_SIZE)
+        store.add_many([batch[i : i + DIGEST_SIZE] for i in range(0, len(batch), DIGEST_SIZE)])
+    store.merge()
+    elapsed = time.perf_counter() - start
+    print(f"Inserted {len(store):,} fingerprints in {elapsed:.1f} sec ({len(store) / elapsed:,.0f} / sec)")
+    print(f"On disk: {os.path.getsize(path) / len(store):.0f} bytes / fingerprint")
+    store.close()
+
+    start = time.perf_counter()
+    store = FingerprintStore(path)
+    print(f"Opened in {(time.perf_counter() - start) * 1000:.2f} ms")
+
+    # half the lookups are stored fingerprints, half are new
+    # (`bytes` of a single item would strip trailing null bytes, so split the raw buffer instead)
+    stored = store.sorted[rng.integers(0, len(store), args.batch_size // 2)].tobytes()
+    queries = [stored[i : i + DIGEST_SIZE] for i in range(0, len(stored), DIGEST_SIZE)]
+    queries += [rng.bytes(DIGEST_SIZE) for _ in range(args.batch_size // 2)]
+    start = time.perf_counter()
+    found = store.contains_many(queries)
+    elapsed = time.perf_counter() - start
+    print(f"Batch lookup: {len(queries) / elapsed:,.0f} lookups / sec, {found.sum():,} found")
+    store.close()
+
+    # a set of hex strings, for comparison
+    sample = {rng.bytes(DIGEST_SIZE).hex() for _ in range(100_000)}
+    per_entry = (sys.getsizeof(sample) + sum(sys.getsizeof(fingerprint) for fingerprint in sample)) / len(sample)
+    print(f"In memory set of hex strings: {per_entry:.0f} bytes / fingerprint")
+    shutil.rmtree(directory)
@@ -0,0 +1,141 @@
+"""
+Function-level clone detection using Merkle subtree hashes.
+
+A single fingerprint per script is defeated by changing a single line. Instead, every node gets a Merkle hash computed
+bottom-up - the hash of its own normalized token & the hashes of its children - in a single post-order pass over the
+AST. Each node is hashed once & its hash is reused by its parent, so the cost is linear in the size of the AST.
+
+The hashes of `FunctionDef`, `AsyncFunctionDef` & `ClassDef` subtrees are stored in an index, digest -> locations.
+Functions (or classes) with the same digest are clones, ie - the same code up to identifiers & literals, wherever they
+are in whichever file.
+
+    python merkle_clones.py <directory> [--min-nodes 30]
+"""
+
+import argparse
+import ast
+import hashlib
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from itertools import combinations
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from code_fingerprinting import child_nodes, node_token
+
+UNITS = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+
+
+@dataclass(frozen=True)
+class Location:
+    path: str
+    name: str  # qualified name, eg - `Class.method`
+    lineno: int
+    end_lineno: int
+    nodes: int  # size of the subtree
+
+
+def merkle_hash(token: bytes, child_digests: List[bytes]) -> bytes:
+    # children are in order, so `f(a, b)` & `f(b, a)` get different hashes
+    return hashlib.blake2b(token + b"".join(child_digests), digest_size=16).digest()
+
+
+def iter_unit_hashes(tree: ast.AST, min_nodes: int = 1) -> Iterator[Tuple[ast.AST, str, bytes, int]]:
+    """
+    Yield (node, qualified name, digest, number of nodes) of every function & class in the tree, in post-order.
+
+    An iterative post-order walk - a node is pushed once to expand its children & once more to hash it, after the
+    digests of all its children are on the `digests` stack.
+    """
+    digests: List[Tuple[bytes, int]] = []  # (digest, size) of the subtrees hashed so far, whose parent isn't yet
+    stack: List[Tuple[ast.AST, Optional[int], str]] = [(tree, None, "")]
+    while stack:
+        node, n_children, scope = stack.pop()
+        if n_children is None:
+            children = child_nodes(node)
+            if isinstance(node, UNITS):
+                scope = f"{scope}.{node.name}" if scope else node.name
+            stack.append((node, len(children), scope))
+            stack.extend((child, None, scope) for child in reversed(children))
+            continue
+
+        children = digests[len(digests) - n_children :]
+        del digests[len(digests) - n_children :]
+        digest = merkle_hash(node_token(node), [child_digest for child_digest, _ in children])
+        size = 1 + sum(child_size for _, child_size in children)
+        digests.append((digest, size))
+        if isinstance(node, UNITS) and size >= min_nodes:
+            yield node, scope, digest, size
+
+
+class CloneIndex:
+    def __init__(self, min_nodes: int = 30):
+        # tiny functions (eg - `return self.x`) are the same everywhere & not interesting
+        self.min_nodes = min_nodes
+        self.index: Dict[bytes, List[Location]] = defaultdict(list)
+        # unit -> digest of the unit it is nested in, to skip clones which are only part of a bigger clone
+        self.parents: Dict[Location, bytes] = {}
+
+    def add_tree(self, path: str, tree: ast.AST) -> None:
+        # post-order, so the units nested in a unit are yielded right before it - they are a suffix of `pending`
+        pending: List[Location] = []
+        for node, name, digest, size in iter_unit_hashes(tree, self.min_nodes):
+            location = Location(path, name, node.lineno, node.end_lineno, size)
+            self.index[digest].append(location)
+            while pending and location.lineno <= pending[-1].lineno and pending[-1].end_lineno <= location.end_lineno:
+                self.parents[pending.pop()] = digest
+            pending.append(location)
+
+    def add_file(self, path: str) -> bool:
+        with open(path, "rb") as f:
+            source = f.read()
+        try:
+            tree = ast.parse(source)
+        except (SyntaxError, ValueError, RecursionError):
+            return False
+        self.add_tree(path, tree)
+        return True
+
+    def clone_groups(self) -> List[List[Location]]:
+        """
+        Groups of 2+ functions / classes with the same hash, largest first.
+
+        A group is skipped if every member is nested in a unit which is a clone too (eg - the methods of a cloned class),
+        since it is already reported as part of the bigger clone.
+        """
+        groups = []
+        for digest, locations in self.index.items():
+            if len(locations) < 2:
+                continue
+            if all(len(self.index.get(self.parents.get(loc), ())) > 1 for loc in locations):
+                continue
+            groups.append(locations)
+        return sorted(groups, key=lambda group: -group[0].nodes)
+
+    def clone_pairs(self) -> Iterator[Tuple[Location, Location]]:
+        for group in self.clone_groups():
+            yield from combinations(group, 2)
+
+
+if __name__ == "__main__":
+    from fingerprint_corpus import walk_python_files
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("root", help="directory to search for clones")
+    parser.add_argument("--min-nodes", type=int, default=30, help="ignore functions & classes smaller than this")
+    parser.add_argument("--top", type=int, default=10, help="number of clone groups to print")
+    args = parser.parse_args()
+
+    clones = CloneIndex(args.min_nodes)
+    start = time.perf_counter()
+    files = sum(clones.add_file(path) for path, _, _ in walk_python_files(args.root))
+    elapsed = time.perf_counter() - start
+    units = sum(len(locations) for locations in clones.index.values())
+    groups = clones.clone_groups()
+    print(f"Indexed {units} functions & classes from {files} files in {elapsed:.2f} sec")
+    print(f"{len(groups)} clone groups, {sum(1 for _ in clones.clone_pairs())} clone pairs")
+
+    for group in groups[: args.top]:
+        print(f"\n{group[0].nodes} nodes, {len(group)} copies:")
+        for location in group:
+            print(f"  {location.path}:{location.lineno}-{location.end_lineno} {location.name}")
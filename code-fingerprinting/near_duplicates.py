@@ -0,0 +1,196 @@
+"""
+Near-duplicate detection using MinHash & Locality Sensitive Hashing (LSH).
+
+`detect_duplicate_script` only catches scripts whose normalized AST is exactly the same. To catch near duplicates (eg - a
+copied script with a few statements added or removed), we compare scripts by the Jaccard similarity of their shingles.
+
+1. Shingles - every k consecutive tokens of the normalized token stream (k-grams), hashed to 32 bits.
+2. MinHash - for each of `num_perm` random hash functions, keep the minimum hash over all the shingles. The probability
+   of two scripts having the same minimum for a hash function equals the Jaccard similarity of their shingle sets, so
+   the fraction of equal values in two signatures estimates their similarity.
+3. LSH banding - the signature is split into `b` bands of `r` rows. Two scripts become candidates if all the rows of at
+   least one band are equal, which happens with probability `1 - (1 - s^r)^b` for similarity `s`. This is an S-curve
+   with its threshold around `(1/b)^(1/r)`, so scripts above the threshold almost always share a bucket while
+   dissimilar ones almost never do. A query looks up `b` buckets instead of comparing against every stored script.
+"""
+
+import ast
+import hashlib
+import time
+import zlib
+from collections import defaultdict
+from typing import Dict, Hashable, List, Tuple
+
+import numpy as np
+
+from code_fingerprinting import iter_normalized_tokens
+
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+
+# Tokens are mapped to stable 32-bit ids (crc32), so shingles are the same across processes & restarts
+_TOKEN_IDS: Dict[bytes, int] = {}
+
+
+def token_ids(tree: ast.AST) -> np.ndarray:
+    ids = []
+    for token in iter_normalized_tokens(tree):
+        token_id = _TOKEN_IDS.get(token)
+        if token_id is None:
+            token_id = _TOKEN_IDS[token] = zlib.crc32(token)
+        ids.append(token_id)
+    return np.array(ids, dtype=np.uint64)
+
+
+def shingles(script: str, k: int = 5) -> np.ndarray:
+    """Unique 32-bit hashes of every k consecutive tokens of the normalized script."""
+    ids = token_ids(ast.parse(script))
+    if len(ids) < k:
+        k = max(len(ids), 1)
+    n = len(ids) - k + 1
+    # polynomial hash of each k-gram - h = id[0] * B^(k-1) + id[1] * B^(k-2) + ... (wrapping around 2^64)
+    base = np.uint64(1_000_003)
+    hashes = np.zeros(max(n, 1), dtype=np.uint64)
+    for i in range(k):
+        hashes = hashes * base + ids[i : i + n]
+    return np.unique((hashes ^ (hashes >> np.uint64(32))) & MAX_HASH)
+
+
+class MinHasher:
+    def __init__(self, num_perm: int = 128, seed: int = 1):
+        # hash functions h(x) = (a * x + b) mod p
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self.a = rng.randint(1, 2**61 - 1, size=num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, 2**61 - 1, size=num_perm, dtype=np.uint64)
+
+    def signature(self, shingle_hashes: np.ndarray, chunk_size: int = 4096) -> np.ndarray:
+        signature = np.full(self.num_perm, MAX_HASH, dtype=np.uint64)
+        # (num_perm, chunk_size) matrix of hashes at a time, to bound the memory for large scripts
+        for start in range(0, len(shingle_hashes), chunk_size):
+            chunk = shingle_hashes[start : start + chunk_size]
+            hashes = (np.outer(self.a, chunk) + self.b[:, None]) % MERSENNE_PRIME
+            np.minimum(signature, (hashes & MAX_HASH).min(axis=1), out=signature)
+        return signature.astype(np.uint32)
+
+
+def lsh_params(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """Pick (bands, rows) with `bands * rows <= num_perm` whose S-curve threshold is closest to `threshold`."""
+    candidates = [
+        (bands, num_perm // bands) for bands in range(1, num_perm + 1) if num_perm // bands > 0
+    ]
+    return min(candidates, key=lambda params: abs((1 / params[0]) ** (1 / params[1]) - threshold))
+
+
+def jaccard_estimate(signature1: np.ndarray, signature2: np.ndarray) -> float:
+    return float(np.mean(signature1 == signature2))
+
+
+class LSHIndex:
+    def __init__(self, threshold: float = 0.8, num_perm: int = 128):
+        self.threshold = threshold
+        self.bands, self.rows = lsh_params(threshold, num_perm)
+        # one hash table per band, band hash -> ids of the scripts in that bucket
+        self.tables: List[Dict[bytes, List[Hashable]]] = [defaultdict(list) for _ in range(self.bands)]
+        self.signatures: Dict[Hashable, np.ndarray] = {}
+
+    def band_keys(self, signature: np.ndarray) -> List[bytes]:
+        # a stable digest (unlike the salted built-in `hash`), so the keys are the same in every process
+        return [
+            hashlib.blake2b(signature[band * self.rows : (band + 1) * self.rows].tobytes(), digest_size=8).digest()
+            for band in range(self.bands)
+        ]
+
+    def add(self, doc_id: Hashable, signature: np.ndarray) -> None:
+        self.signatures[doc_id] = signature
+        for table, key in zip(self.tables, self.band_keys(signature)):
+            table[key].append(doc_id)
+
+    def query(self, signature: np.ndarray) -> List[Tuple[Hashable, float]]:
+        """Stored scripts whose estimated Jaccard similarity is above the threshold, most similar first."""
+        candidates = set()
+        for table, key in zip(self.tables, self.band_keys(signature)):
+            candidates.update(table.get(key, ()))
+        # the candidates are only likely to be similar, verify using the full signatures
+        matches = [(doc_id, jaccard_estimate(signature, self.signatures[doc_id])) for doc_id in candidates]
+        return sorted(
+            [(doc_id, similarity) for doc_id, similarity in matches if similarity >= self.threshold],
+            key=lambda match: -match[1],
+        )
+
+
+class NearDuplicateDetector:
+    def __init__(self, threshold: float = 0.8, num_perm: int = 128, k: int = 5):
+        self.k = k
+        self.minhasher = MinHasher(num_perm)
+        self.index = LSHIndex(threshold, num_perm)
+
+    def signature(self, script: str) -> np.ndarray:
+        return self.minhasher.signature(shingles(script, self.k))
+
+    def add(self, doc_id: Hashable, script: str) -> None:
+        self.index.add(doc_id, self.signature(script))
+
+    def find_similar(self, script: str) -> List[Tuple[Hashable, float]]:
+        return self.index.query(self.signature(script))
+
+
+def exact_jaccard(shingles1: np.ndarray, shingles2: np.ndarray) -> float:
+    intersection = len(np.intersect1d(shingles1, shingles2, assume_unique=True))
+    return intersection / (len(shingles1) + len(shingles2) - intersection)
+
+
+def drop_statements(script: str, every: int) -> str:
+    """Simulate an edited copy of a script by dropping every `every`-th statement of every block."""
+    tree = ast.parse(script)
+    for node in ast.walk(tree):
+        body = getattr(node, "body", None)
+        if isinstance(body, list) and len(body) > 1:
+            node.body = [statement for i, statement in enumerate(body) if i % every != every - 1]
+    return ast.unparse(tree)
+
+
+if __name__ == "__main__":
+    import os
+    import sys
+
+    from benchmark import load_corpus
+
+    root = sys.argv[1] if len(sys.argv) > 1 else os.path.dirname(os.__file__)
+    sources = [source for source in load_corpus(root) if len(source) > 2000][:2000]
+    detector = NearDuplicateDetector(threshold=0.8)
+    print(f"LSH with {detector.index.bands} bands x {detector.index.rows} rows")
+
+    start = time.perf_counter()
+    signatures = [detector.signature(source) for source in sources]
+    for doc_id, signature in enumerate(signatures):
+        detector.index.add(doc_id, signature)
+    print(f"Indexed {len(sources)} scripts in {time.perf_counter() - start:.2f} sec")
+
+    # edited copies of some of the scripts should find their originals
+    found, total, lsh_time, brute_force_time = 0, 0, 0.0, 0.0
+    for doc_id in range(0, len(sources), 20):
+        signature = detector.signature(drop_statements(sources[doc_id], every=20))
+        total += 1
+
+        start = time.perf_counter()
+        matches = detector.index.query(signature)
+        lsh_time += time.perf_counter() - start
+        found += doc_id in {match[0] for match in matches}
+
+        start = time.perf_counter()
+        [jaccard_estimate(signature, other) for other in signatures]
+        brute_force_time += time.perf_counter() - start
+
+    print(f"Found the original of {found}/{total} edited scripts")
+    print(
+        f"Query time: LSH {lsh_time / total * 1000:.3f} ms, "
+        f"comparing with every signature {brute_force_time / total * 1000:.3f} ms"
+    )
+
+    # MinHash estimate vs the exact Jaccard similarity
+    original, edited = sources[0], drop_statements(sources[0], every=10)
+    print(
+        f"Exact Jaccard: {exact_jaccard(shingles(original), shingles(edited)):.3f}, "
+        f"MinHash estimate: {jaccard_estimate(detector.signature(original), detector.signature(edited)):.3f}"
+    )
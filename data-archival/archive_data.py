@@ -1,27 +1,38 @@
 import csv
+import gzip
 import os
 import shutil
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 
 import boto3
 from loguru import logger
-from sqlalchemy import MetaData, Table, and_, create_engine, delete, select
+from psycopg2 import sql
+from sqlalchemy import MetaData, Table, and_, create_engine, delete, func, select, tuple_
 
 CSV_DIR = "/tmp/csv"
+# every read of a window's export sees the same snapshot of the table
+EXPORT_ISOLATION_LEVEL = "REPEATABLE READ"
+# number of ids in each DELETE ... WHERE id IN (...) of an exported window
+DELETE_BATCH_SIZE = 5000
+# S3 requires every part of a multipart upload, except the last, to be at least 5 MB
+PART_SIZE = 8 * 1024 * 1024
 
 
-def upload_to_s3(file_path: str, bucket_name: str, s3_dir: str):
+def upload_to_s3(file_path: str, bucket_name: str, s3_dir: str, s3_client=None):
     """
     Uploads a file to an S3 bucket in a specified directory.
 
     :param file_path: Path to the file to upload
     :param bucket_name: Name of the S3 bucket
     :param s3_dir: Directory in the S3 bucket to upload the file to
+    :param s3_client: boto3 S3 client, created if not given
     """
 
     try:
-        s3_client = boto3.client("s3")
+        s3_client = s3_client or boto3.client("s3")
         s3_key = f"{s3_dir}/{file_path.split('/')[-1]}"
         s3_client.upload_file(file_path, bucket_name, s3_key)
         logger.info(
@@ -32,33 +43,167 @@ def upload_to_s3(file_path: str, bucket_name: str, s3_dir: str):
         raise e
 
 
+class S3MultipartUpload:
+    """
+    A write-only file object which uploads everything written to it to S3, one part at a time.
+
+    Only the current part (`PART_SIZE` bytes) is kept in memory. `close` uploads the last part & completes the upload,
+    `abort` discards the uploaded parts, so that no partial object is left in the bucket.
+    """
+
+    def __init__(self, s3_client, bucket_name: str, s3_key: str, part_size: int = PART_SIZE):
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.s3_key = s3_key
+        self.part_size = part_size
+        self.buffer = bytearray()
+        self.parts = []
+        self.bytes_written = 0
+        self.upload_id = s3_client.create_multipart_upload(Bucket=bucket_name, Key=s3_key)["UploadId"]
+
+    def write(self, data: bytes) -> int:
+        self.buffer += data
+        self.bytes_written += len(data)
+        while len(self.buffer) >= self.part_size:
+            self._upload_part(bytes(self.buffer[: self.part_size]))
+            del self.buffer[: self.part_size]
+        return len(data)
+
+    def flush(self):
+        # parts are uploaded as soon as they are full, as S3 doesn't accept smaller parts
+        pass
+
+    def _upload_part(self, body: bytes):
+        part_number = len(self.parts) + 1
+        response = self.s3_client.upload_part(
+            Bucket=self.bucket_name,
+            Key=self.s3_key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=body,
+        )
+        self.parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+
+    def close(self):
+        # the last part can be smaller than 5 MB (& an empty upload still needs a part)
+        if self.buffer or not self.parts:
+            self._upload_part(bytes(self.buffer))
+            self.buffer.clear()
+        self.s3_client.complete_multipart_upload(
+            Bucket=self.bucket_name,
+            Key=self.s3_key,
+            UploadId=self.upload_id,
+            MultipartUpload={"Parts": self.parts},
+        )
+
+    def abort(self):
+        self.s3_client.abort_multipart_upload(Bucket=self.bucket_name, Key=self.s3_key, UploadId=self.upload_id)
+
+
+def copy_to_s3(conn, table_ref: Table, min_date, max_date, bucket_name: str, s3_key: str, s3_client=None) -> int:
+    """
+    Exports the rows between min_date and max_date straight from PostgreSQL to a gzipped CSV file in S3.
+
+    `COPY (SELECT ...) TO STDOUT` makes PostgreSQL format the rows as CSV itself & stream them over the connection, so
+    the rows aren't fetched as Python objects in pages. The stream is compressed & uploaded part by part while it is
+    being read - nothing is written to the disk. Nothing is uploaded if there are no rows in the window.
+
+    The rows are counted with `SELECT count(*)` before the COPY, rather than with the cursor's `rowcount` after it (which
+    psycopg2 doesn't document for `COPY TO`). Run it in a `REPEATABLE READ` transaction (`EXPORT_ISOLATION_LEVEL`), so
+    that the count & the COPY see the same snapshot & the count is exactly the number of rows in the file.
+
+    :param conn: Database active connection
+    :param table_ref: Table reference
+    :param min_date: Start date
+    :param max_date: End date
+    :param bucket_name: Name of the S3 bucket
+    :param s3_key: S3 key of the gzipped CSV file
+    :param s3_client: boto3 S3 client, created if not given
+    :return: Number of rows exported
+    """
+
+    s3_client = s3_client or boto3.client("s3")
+    copy_query = sql.SQL(
+        "COPY (SELECT * FROM {table} WHERE triggered_at >= %s AND triggered_at < %s ORDER BY triggered_at, id) "
+        "TO STDOUT WITH (FORMAT csv, HEADER)"
+    ).format(table=sql.Identifier(table_ref.schema, table_ref.name))
+
+    start_time = time.time()
+    rows_exported = conn.execute(
+        select(func.count())
+        .select_from(table_ref)
+        .where(and_(table_ref.c.triggered_at >= min_date, table_ref.c.triggered_at < max_date))
+    ).scalar()
+    if rows_exported == 0:
+        logger.warning(f"No rows found from {min_date} to {max_date}. Skipped S3 upload: {s3_key}")
+        return 0
+
+    upload = S3MultipartUpload(s3_client, bucket_name, s3_key)
+    try:
+        # the DB-API (psycopg2) connection of the SQLAlchemy connection, so the COPY runs in the same transaction
+        cursor = conn.connection.cursor()
+        try:
+            # level 6 (the default of the gzip CLI) is much faster than 9 & compresses CSV almost as well
+            with gzip.GzipFile(fileobj=upload, mode="wb", compresslevel=6) as gzip_file:
+                cursor.copy_expert(cursor.mogrify(copy_query, (min_date, max_date)).decode(), gzip_file)
+        finally:
+            cursor.close()
+
+        upload.close()
+    except Exception as e:
+        logger.error(
+            f"Failed to copy data to S3. Start: {min_date} & End: {max_date}, S3 Key: {s3_key}. Exception: {e}"
+        )
+        upload.abort()
+        raise e
+
+    elapsed = time.time() - start_time
+    logger.info(
+        f"Copied {rows_exported} rows from {min_date} to {max_date} to S3 Bucket:{bucket_name}, S3 Key: {s3_key}. "
+        f"Compressed size: {upload.bytes_written / 1024 / 1024:.2f} MB, Time taken: {elapsed:.2f} sec, "
+        f"Rows/sec: {rows_exported / max(elapsed, 1e-9):.0f}"
+    )
+    return rows_exported
+
+
 def data_to_csv(conn: str, csv_file_path: str, table_ref: Table, min_date: str, max_date: str):
     """
     Fetches data from a DB table and writes it to a CSV file.
 
+    The rows are fetched in pages with keyset pagination - ordered by (triggered_at, id) & every page starts right
+    after the last row of the previous page. Unlike OFFSET, the database doesn't have to read & skip the previous
+    pages, & no row is skipped or repeated between pages.
+
     :param conn: Database active connection
     :param csv_file_path: CSV file path to write data in
     :param table_ref: Table reference
     :param min_date: Start date
     :param max_date: End date
+    :return: Number of rows exported
     """
 
-    offset = 0
     limit = 5000  # this can be configured
+    # (triggered_at, id) of the last row written
+    last_key = None
+    total_rows = 0
+    export_start_time = time.time()
     try:
         with open(csv_file_path, "w", newline="") as csvfile:
             csv_writer = csv.writer(csvfile)
             while True:
+                conditions = [
+                    table_ref.c.triggered_at < max_date,
+                    table_ref.c.triggered_at >= min_date,
+                ]
+                if last_key is not None:
+                    conditions.append(
+                        tuple_(table_ref.c.triggered_at, table_ref.c.id) > tuple_(*last_key)
+                    )
                 query = (
                     select(table_ref)
-                    .where(
-                        and_(
-                            table_ref.c.triggered_at < max_date,
-                            table_ref.c.triggered_at >= min_date,
-                        )
-                    )
+                    .where(and_(*conditions))
+                    .order_by(table_ref.c.triggered_at, table_ref.c.id)
                     .limit(limit)
-                    .offset(offset)
                 )
 
                 start_time = time.time()
@@ -70,33 +215,37 @@ def data_to_csv(conn: str, csv_file_path: str, table_ref: Table, min_date: str,
                     f"Time taken to fetch data: {time.time() - start_time:.2f} sec"
                 )
 
-                if offset == 0 and not rows:
+                if last_key is None and not rows:
                     os.remove(csv_file_path)
                     logger.warning(f"Deleted empty CSV file: {csv_file_path}")
                     break
 
-                if offset == 0 and rows:
+                if last_key is None:
                     csv_writer.writerow(result.keys())
 
-                offset += limit
-                if not rows:
-                    logger.info(
-                        f"Data exported to CSV file:{csv_file_path} successfully"
-                    )
-                    break
                 csv_writer.writerows(rows)
+                total_rows += len(rows)
+                if rows:
+                    last_key = (rows[-1].triggered_at, rows[-1].id)
 
                 # if rows fetched are less than limit, then it's the last batch
                 if len(rows) < limit:
+                    elapsed = time.time() - export_start_time
+                    logger.info(
+                        f"Data exported to CSV file:{csv_file_path} successfully. "
+                        f"Rows: {total_rows}, Time taken: {elapsed:.2f} sec, "
+                        f"Rows/sec: {total_rows / max(elapsed, 1e-9):.0f}"
+                    )
                     break
     except Exception as e:
         logger.error(
             f"Failed to fetch and write data. Start: {min_date} & End: {max_date}. Exception: {e}"
         )
         raise e
+    return total_rows
 
 
-def delete_data_from_table(conn, table_ref, table_name, min_date, max_date):
+def delete_data_from_table(conn, table_ref, table_name, min_date, max_date, ids=None):
     """
     Deleting data from table between min_date and max_date
 
@@ -105,16 +254,21 @@ def delete_data_from_table(conn, table_ref, table_name, min_date, max_date):
     :param table_name: Table name from which data needs to be deleted
     :param min_date: Start date
     :param max_date: End date
+    :param ids: ids of the exported rows (`exported_ids`). Only these rows are deleted, `DELETE_BATCH_SIZE` at a time
     """
     try:
         start_time = time.time()
-        delete_query = delete(table_ref).where(
-            and_(
-                table_ref.c.triggered_at < max_date,
-                table_ref.c.triggered_at >= min_date,
-            )
+        window = and_(
+            table_ref.c.triggered_at < max_date,
+            table_ref.c.triggered_at >= min_date,
         )
-        rows_deleted = conn.execute(delete_query).rowcount
+        if ids is None:
+            rows_deleted = conn.execute(delete(table_ref).where(window)).rowcount
+        else:
+            rows_deleted = 0
+            for i in range(0, len(ids), DELETE_BATCH_SIZE):
+                batch = ids[i : i + DELETE_BATCH_SIZE]
+                rows_deleted += conn.execute(delete(table_ref).where(window, table_ref.c.id.in_(batch))).rowcount
         logger.info(
             f"Deleted {rows_deleted} rows from table {table_name} from {min_date} to {max_date}"
         )
@@ -124,24 +278,88 @@ def delete_data_from_table(conn, table_ref, table_name, min_date, max_date):
         raise e
 
 
-def export_data_to_s3(db_conn_string, table_name, cutoff_date, s3_bucket, s3_dir):
+def hour_windows(min_date, cutoff_date):
+    """Yields (start, end) of every hour from min_date till cutoff_date."""
+    while min_date < cutoff_date:
+        yield min_date, min_date + timedelta(hours=1)
+        min_date += timedelta(hours=1)
+
+
+def exported_ids(conn, table_ref, min_date, max_date):
+    """ids of the rows in the window, in the order of the export."""
+    query = (
+        select(table_ref.c.id)
+        .where(and_(table_ref.c.triggered_at < max_date, table_ref.c.triggered_at >= min_date))
+        .order_by(table_ref.c.triggered_at, table_ref.c.id)
+    )
+    return conn.execute(query).scalars().all()
+
+
+def export_window(engine, table_ref, min_date, max_date, s3_bucket, s3_dir, use_copy, s3_client):
+    """
+    Exports the data of one window to S3 on its own connection from the engine's pool. The data isn't deleted here.
+
+    The ids & the export read the same snapshot of the table (`EXPORT_ISOLATION_LEVEL`), so the ids are exactly the
+    ids of the exported rows.
+
+    :return: Number of rows exported & the ids of the exported rows (`exported_ids`), None if there were none
+    """
+    file_name = f'{min_date.strftime("%Y-%m-%d-%H")}.csv'
+    with engine.connect().execution_options(isolation_level=EXPORT_ISOLATION_LEVEL) as conn:
+        ids = exported_ids(conn, table_ref, min_date, max_date)
+        if not ids:
+            logger.info(f"No rows found from {min_date} to {max_date}")
+            return 0, None
+
+        if use_copy:
+            # streaming data from table to a gzipped csv in s3, without a local file
+            s3_key = f"{s3_dir}/{file_name}.gz"
+            return copy_to_s3(conn, table_ref, min_date, max_date, s3_bucket, s3_key, s3_client), ids
+
+        csv_file_path = f"{CSV_DIR}/{file_name}"
+
+        # fetching data from table and writing it in csv
+        rows_exported = data_to_csv(conn, csv_file_path, table_ref, min_date, max_date)
+
+        # uploading csv file to s3 & removing it, so that only the files of the windows in flight are on the disk
+        if os.path.exists(csv_file_path):
+            upload_to_s3(csv_file_path, s3_bucket, s3_dir, s3_client)
+            os.remove(csv_file_path)
+        return rows_exported, ids
+
+
+def export_data_to_s3(db_conn_string, table_name, cutoff_date, s3_bucket, s3_dir, use_copy=False, concurrency=1):
     """
     Exporting data (for particular dates) to csv, zip, upload to S3, and then delete data from database
 
+    Up to `concurrency` hour windows are exported (fetched & uploaded) at the same time by a pool of worker threads,
+    each on its own connection, so one window is being uploaded while the next one is being fetched. The exported
+    windows are deleted & committed one at a time, strictly in order of time - if a window fails, nothing after it is
+    deleted & the next run starts again from the oldest remaining window. Re-exporting a window overwrites the same S3
+    file & deleting it again deletes nothing, so a window can safely be archived more than once.
+
+    A window is exported & deleted in different transactions, so rows can be inserted into it in between. Only the ids
+    read in the export's snapshot are deleted, so these rows stay in the table for the next run.
+
     :param db_conn_string: PostgreSQL connection string
     :param schema_table_name: Name of the schema & table to query data from
     :param cutoff_date: CutOff date, data will be exported till cutoff_date
     :param s3_bucket: S3 Bucket name
     :param s3_dir: Directory in S3 bucket to upload the file to
+    :param use_copy: Stream the data with COPY straight to a gzipped CSV file in S3 (`copy_to_s3`), instead of
+        fetching it to a local CSV file first
+    :param concurrency: Number of hour windows exported at the same time
     """
     schema, table = table_name.split(".")
 
-    # Creating a database engine (autocommit is False by default)
-    engine = create_engine(db_conn_string)
+    # Creating a database engine (autocommit is False by default) with a connection per worker & one for the deletes
+    engine = create_engine(db_conn_string, pool_size=concurrency + 1)
     metadata = MetaData(schema=schema)
 
     # Reflect the table structure from the database
     table_ref = Table(table, metadata, autoload_with=engine)
+    # created once & shared, as boto3 clients are thread safe but creating them isn't
+    s3_client = boto3.client("s3")
 
     # Creating a database connection
     with engine.connect() as conn:
@@ -160,29 +378,53 @@ def export_data_to_s3(db_conn_string, table_name, cutoff_date, s3_bucket, s3_dir
                 return False
 
             min_date = datetime.combine(min_date_result[0], datetime.min.time())
-            max_date = min_date + timedelta(hours=1)
-            logger.info(f"SCHEDULING EXPORT FROM {min_date} TO {cutoff_date}")
-
-            # looping hour by hour till min_date exceeds cutoff date
-            while min_date < cutoff_date:
-                csv_file_path = f'{CSV_DIR}/{min_date.strftime("%Y-%m-%d-%H")}.csv'
-
-                # fetching data from table and writing it in csv
-                data_to_csv(conn, csv_file_path, table_ref, min_date, max_date)
-
-                # zipping csv file, uploading to s3, and removing files after each operation is finished.
-                if os.path.exists(csv_file_path):
-                    upload_to_s3(csv_file_path, s3_bucket, s3_dir)
-
-                # deleting exported data from table
-                delete_data_from_table(conn, table_ref, table_name, min_date, max_date)
-
-                # commiting transaction as deletion of data is successful
-                conn.commit()
-
-                # changing min_date and max_date to iterate over next hour
-                min_date = max_date
-                max_date += timedelta(hours=1)
+            logger.info(f"SCHEDULING EXPORT FROM {min_date} TO {cutoff_date} WITH CONCURRENCY {concurrency}")
+
+            windows = hour_windows(min_date, cutoff_date)
+            # (window, future) of the windows being exported, oldest first. A few more windows than workers are
+            # queued so that no worker waits for the deletes, while bounding the exported but not deleted windows.
+            in_flight = deque()
+            start_time = time.time()
+            windows_archived = 0
+            rows_archived = 0
+
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                while True:
+                    for window in windows:
+                        future = executor.submit(
+                            export_window, engine, table_ref, *window, s3_bucket, s3_dir, use_copy, s3_client
+                        )
+                        in_flight.append((window, future))
+                        if len(in_flight) >= 2 * concurrency:
+                            break
+                    if not in_flight:
+                        break
+
+                    (window_start, window_end), future = in_flight.popleft()
+                    try:
+                        rows_exported, ids = future.result()
+                    except Exception:
+                        # don't start the windows which are still queued
+                        for _, queued in in_flight:
+                            queued.cancel()
+                        raise
+
+                    # deleting exported data from table, unless the window was empty when it was exported
+                    if ids is not None:
+                        delete_data_from_table(conn, table_ref, table_name, window_start, window_end, ids)
+
+                        # commiting transaction as deletion of data is successful
+                        conn.commit()
+
+                    windows_archived += 1
+                    rows_archived += rows_exported
+                    elapsed = time.time() - start_time
+                    logger.info(
+                        f"Archived {window_start} to {window_end}. Total: {windows_archived} hours, "
+                        f"{rows_archived} rows in {elapsed:.2f} sec, "
+                        f"Hours/min: {windows_archived * 60 / max(elapsed, 1e-9):.1f}, "
+                        f"Rows/sec: {rows_archived / max(elapsed, 1e-9):.0f}"
+                    )
 
         except Exception as e:
             logger.exception(f"Exporting data failed. Exception: {e}")
@@ -191,7 +433,7 @@ def export_data_to_s3(db_conn_string, table_name, cutoff_date, s3_bucket, s3_dir
             raise e
 
 
-def export_data(rds_connection_string, schema_table_name, n_days, bucket_name, s3_dir):
+def export_data(rds_connection_string, schema_table_name, n_days, bucket_name, s3_dir, use_copy=False, concurrency=1):
     """
     Connects to an RDS PostgreSQL database, retrieves data older than specified number of days from a given table,
     exports the data to a CSV file, and stores the CSV file locally.
@@ -201,6 +443,8 @@ def export_data(rds_connection_string, schema_table_name, n_days, bucket_name, s
     :param n_days: Number of days to filter data older than
     :param bucket_name: S3 Bucket name
     :param s3_dir: S3 Dir, files to be uploaded on
+    :param use_copy: Stream the data with COPY straight to S3, without a local CSV file
+    :param concurrency: Number of hour windows exported at the same time
     """
     logger.info(f"N_DAYS: {n_days}")
     try:
@@ -214,7 +458,7 @@ def export_data(rds_connection_string, schema_table_name, n_days, bucket_name, s
 
         # exporting data from database to csv, csv -> zip, uploading zip file to S3 and deleting data from database.
         export_data_to_s3(
-            rds_connection_string, schema_table_name, cutoff_date, bucket_name, s3_dir
+            rds_connection_string, schema_table_name, cutoff_date, bucket_name, s3_dir, use_copy, concurrency
         )
 
         logger.info(f"Data older than {n_days} days exported successfully")
@@ -240,6 +484,10 @@ def main():
 
     S3_BUCKET = os.environ.get("S3_BUCKET")
     N_DAYS = int(os.environ.get("N_DAYS", -1))
+    # COPY the data straight to gzipped CSV files in S3, instead of going through local CSV files
+    USE_COPY = os.environ.get("USE_COPY", "false").lower() == "true"
+    # number of hour windows exported at the same time
+    CONCURRENCY = int(os.environ.get("CONCURRENCY", 1))
 
     conn_string = (
         f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
@@ -257,6 +505,8 @@ def main():
             N_DAYS,
             S3_BUCKET,
             s3_dir,
+            USE_COPY,
+            CONCURRENCY,
         )
 
 
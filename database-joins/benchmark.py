@@ -0,0 +1,323 @@
+"""
+Benchmarks of the join algorithms on generated `employees` & `departments` tables.
+
+    python benchmark.py grace [--employees 10000000] [--departments 1000000] [--budget 100000]
+    python benchmark.py columnar [--employees 1000000] [--departments 10000]
+    python benchmark.py streaming [--employees 2000000] [--departments 100000]
+    python benchmark.py nested [--employees 20000] [--departments 2000]
+    python benchmark.py planner
+    python benchmark.py parallel [--employees 10000000] [--departments 1000000] [--workers 1 2 4 8 16 32]
+
+grace - the in-memory hash join vs the Grace hash join with a memory budget smaller than the build table. Both tables are
+generated lazily & the results are counted (not collected), so the peak memory is that of the join itself. Every case
+runs in its own process, so the peak RSS of one doesn't hide the other's.
+
+columnar - the row based joins (lists of dataclasses) vs the vectorized joins of `columnar_join.py`, both producing
+only the matching index pairs & also materializing all 4 output columns. Building the tables isn't timed. The nested
+loop join is skipped for large tables.
+
+streaming - the query "employees of every 10th department, with their department name" as a pipeline of iterator
+operators (scan -> filter -> hash join -> project) vs `hash_join` on lists, filtered before the join. Compares the
+peak RSS (each in its own process, like grace) & the time until the first row is available.
+
+nested - the nested loop join & its block & index variants vs the hash & merge joins. The indexes are prebuilt (like a
+table's index), so building them isn't timed.
+
+planner - runs every candidate plan of `join_planner.py` on a matrix of tiny / huge, sorted / unsorted & skewed inputs,
+& compares the plan chosen by `join` (including the time to collect the statistics) with the fastest one.
+
+parallel - the radix partitioned parallel hash join of `parallel_join.py` with 1-32 worker processes vs the single
+process columnar hash join, on the join key columns only. Includes partitioning & starting the worker processes.
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import resource
+import time
+from itertools import islice
+from operator import attrgetter
+from typing import Callable, Iterator, List
+
+import numpy as np
+
+import columnar_join
+import iterator_joins
+import join_planner
+import parallel_join
+from hash_join import Department, Employee, Result, grace_hash_join, hash_join
+from merge_join import merge_join
+from nested_loop_join import (
+    HashIndex,
+    SortedIndex,
+    block_nested_loop_join,
+    index_nested_loop_join,
+    nested_loop_join,
+)
+
+# (employees, departments) of every benchmark
+DEFAULT_SIZES = {
+    "grace": (10_000_000, 1_000_000),
+    "columnar": (1_000_000, 10_000),
+    "streaming": (2_000_000, 100_000),
+    "nested": (20_000, 2_000),
+    "planner": (200_000, 100_000),
+    "parallel": (10_000_000, 1_000_000),
+}
+
+
+def generate_employees(n: int, n_departments: int, seed: int = 0) -> Iterator[Employee]:
+    rng = random.Random(seed)
+    for i in range(n):
+        yield Employee(id=i, name=f"employee-{i}", department_id=rng.randrange(n_departments))
+
+
+def generate_departments(n: int) -> Iterator[Department]:
+    for i in range(n):
+        yield Department(id=i, name=f"department-{i}")
+
+
+def run_case(join: Callable[[], Iterator], queue: multiprocessing.Queue) -> None:
+    start = time.perf_counter()
+    rows = iter(join())
+    matches = sum(1 for _ in islice(rows, 1))
+    first_row = time.perf_counter() - start
+    matches += sum(1 for _ in rows)
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is in KB on Linux
+    queue.put((matches, elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, first_row))
+
+
+def measure(join: Callable[[], Iterator]):
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=run_case, args=(join, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def grace_benchmark(n_employees: int, n_departments: int, budget: int) -> None:
+    cases = {
+        "hash join (in memory)": lambda: grace_hash_join(
+            generate_employees(n_employees, n_departments), generate_departments(n_departments), n_departments
+        ),
+        f"grace (budget {budget:,})": lambda: grace_hash_join(
+            generate_employees(n_employees, n_departments), generate_departments(n_departments), budget
+        ),
+    }
+    print(f"{n_employees:,} employees x {n_departments:,} departments")
+    print(f"{'algorithm':<28}{'matches':>12}{'seconds':>10}{'rows/sec':>12}{'peak RSS MB':>14}")
+    for name, join in cases.items():
+        matches, elapsed, peak_rss, _ = measure(join)
+        rows_per_second = (n_employees + n_departments) / elapsed
+        print(f"{name:<28}{matches:>12,}{elapsed:>10.1f}{rows_per_second:>12,.0f}{peak_rss:>14,.0f}")
+
+
+def timed(function: Callable, repeat: int = 3) -> float:
+    """Best of `repeat` runs"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def columnar_benchmark(n_employees: int, n_departments: int) -> None:
+    employees = list(generate_employees(n_employees, n_departments))
+    departments = list(generate_departments(n_departments))
+    employee_table = {
+        "id": np.array([employee.id for employee in employees]),
+        "name": np.array([employee.name for employee in employees], dtype=object),
+        "department_id": np.array([employee.department_id for employee in employees]),
+    }
+    department_table = {
+        "id": np.array([department.id for department in departments]),
+        "name": np.array([department.name for department in departments], dtype=object),
+    }
+    output_columns = (
+        {"employee_id": "id", "employee_name": "name", "department_id": "department_id"},
+        {"department_name": "name"},
+    )
+
+    def columnar(algorithm: str, materialize: bool) -> Callable:
+        def run():
+            indices = columnar_join.join(employee_table, department_table, "department_id", "id", algorithm)
+            if materialize:
+                columnar_join.materialize(employee_table, department_table, indices, *output_columns)
+
+        return run
+
+    # the row based joins build a `Result` per match, so they always materialize
+    cases = {
+        "row nested loop": lambda: nested_loop_join(employees, departments),
+        "row merge": lambda: merge_join(employees, departments),
+        "row hash": lambda: hash_join(employees, departments),
+        "columnar sort merge": columnar("sort_merge", False),
+        "columnar sort merge + columns": columnar("sort_merge", True),
+        "columnar hash": columnar("hash", False),
+        "columnar hash + columns": columnar("hash", True),
+    }
+    timings = {}
+    for name, join in cases.items():
+        if name == "row nested loop" and n_employees * n_departments > 10**8:
+            continue
+        timings[name] = timed(join, repeat=1 if name.startswith("row") else 3)
+
+    print(f"{n_employees:,} employees x {n_departments:,} departments")
+    # speedup relative to the row based hash join
+    print(f"{'algorithm':<32}{'seconds':>10}{'speedup':>10}")
+    for name in cases:
+        if name not in timings:
+            print(f"{name:<32}{'skipped':>10}")
+            continue
+        print(f"{name:<32}{timings[name]:>10.3f}{timings['row hash'] / timings[name]:>9.1f}x")
+
+
+def streaming_benchmark(n_employees: int, n_departments: int) -> None:
+    def selected(department_id: int) -> bool:
+        return department_id % 10 == 0
+
+    # both filter the employees before the join, so only materializing vs streaming differs
+    def lists():
+        employees = [
+            employee for employee in generate_employees(n_employees, n_departments) if selected(employee.department_id)
+        ]
+        departments = list(generate_departments(n_departments))
+        return hash_join(employees, departments)
+
+    def pipeline():
+        employees = iterator_joins.filter_rows(
+            iterator_joins.scan(generate_employees(n_employees, n_departments)),
+            lambda employee: selected(employee.department_id),
+        )
+        departments = iterator_joins.scan(generate_departments(n_departments))
+        matches = iterator_joins.hash_join(employees, departments, attrgetter("department_id"), attrgetter("id"))
+        return iterator_joins.project(
+            matches, lambda match: Result(match[0].id, match[0].name, match[1].id, match[1].name)
+        )
+
+    print(f"{n_employees:,} employees x {n_departments:,} departments")
+    print(f"{'algorithm':<28}{'matches':>12}{'seconds':>10}{'first row (s)':>15}{'peak RSS MB':>14}")
+    for name, join in {"hash_join (lists)": lists, "iterator pipeline": pipeline}.items():
+        matches, elapsed, peak_rss, first_row = measure(join)
+        print(f"{name:<28}{matches:>12,}{elapsed:>10.1f}{first_row:>15.3f}{peak_rss:>14,.0f}")
+
+
+def nested_benchmark(n_employees: int, n_departments: int) -> None:
+    employees = list(generate_employees(n_employees, n_departments))
+    departments = list(generate_departments(n_departments))
+    hash_index, sorted_index = HashIndex(departments), SortedIndex(departments)
+    cases = {
+        "nested loop": lambda: nested_loop_join(employees, departments),
+        "block nested loop (100)": lambda: block_nested_loop_join(employees, departments, block_size=100),
+        "block nested loop (10,000)": lambda: block_nested_loop_join(employees, departments, block_size=10_000),
+        "index nested loop (sorted)": lambda: index_nested_loop_join(employees, sorted_index),
+        "index nested loop (hash)": lambda: index_nested_loop_join(employees, hash_index),
+        "merge": lambda: merge_join(employees, departments),
+        "hash": lambda: hash_join(employees, departments),
+    }
+    print(f"{n_employees:,} employees x {n_departments:,} departments")
+    print(f"{'algorithm':<30}{'seconds':>10}")
+    for name, join in cases.items():
+        print(f"{name:<30}{timed(join, repeat=1):>10.3f}")
+
+
+def planner_scenarios(n_employees: int, n_departments: int):
+    rng = random.Random(0)
+
+    def employees(department_ids) -> list:
+        return [Employee(id=i, name=f"employee-{i}", department_id=id_) for i, id_ in enumerate(department_ids)]
+
+    def departments(n: int) -> list:
+        rows = [Department(id=i, name=f"department-{i}") for i in range(n)]
+        rng.shuffle(rows)
+        return rows
+
+    uniform = [rng.randrange(n_departments) for _ in range(n_employees)]
+    # zipf-like - department k has ~1/k of the employees
+    skewed = [min(int(rng.paretovariate(1.0)) - 1, n_departments - 1) for _ in range(n_employees)]
+    return {
+        "tiny x tiny": (employees([rng.randrange(5) for _ in range(8)]), departments(5)),
+        "tiny x huge": (employees(uniform[:20]), departments(n_departments)),
+        "huge x tiny": (employees([i % 10 for i in uniform]), departments(10)),
+        "huge x huge": (employees(uniform), departments(n_departments)),
+        "huge x huge, sorted": (employees(sorted(uniform)), sorted(departments(n_departments), key=attrgetter("id"))),
+        "huge x huge, skewed": (employees(skewed), departments(n_departments)),
+    }
+
+
+def planner_benchmark(n_employees: int, n_departments: int) -> None:
+    employee_key, department_key = attrgetter("department_id"), attrgetter("id")
+    candidates = {
+        "nested_loop": ("nested_loop", None),
+        "hash_build_left": ("hash", "left"),
+        "hash_build_right": ("hash", "right"),
+        "merge": ("merge", None),
+    }
+    print(f"{'scenario':<22}" + "".join(f"{name:>18}" for name in candidates) + f"{'join()':>18}  chosen")
+    for scenario, (employees, departments) in planner_scenarios(n_employees, n_departments).items():
+        left_stats = join_planner.collect_stats(employees, employee_key)
+        right_stats = join_planner.collect_stats(departments, department_key)
+        chosen = join_planner.plan_join(left_stats, right_stats)
+        chosen_name = next(name for name, plan in candidates.items() if plan == (chosen.algorithm, chosen.build_side))
+
+        timings = {}
+        for name, (algorithm, build_side) in candidates.items():
+            # skip the nested loop on large inputs, unless the planner chose it
+            if algorithm == "nested_loop" and len(employees) * len(departments) > 5 * 10**7 and name != chosen_name:
+                continue
+            plan = join_planner.Plan(algorithm, build_side, 0, 0, not left_stats.is_sorted, not right_stats.is_sorted)
+            matches = lambda: join_planner.execute(plan, employees, departments, employee_key, department_key)
+            timings[name] = timed(lambda: sum(1 for _ in matches()))
+        matches = lambda: join_planner.join(employees, departments, employee_key, department_key)
+        planned = timed(lambda: sum(1 for _ in matches()))
+
+        fastest = min(timings, key=timings.get)
+        row = "".join(f"{timings[name] * 1000:>15.2f} ms" if name in timings else f"{'-':>18}" for name in candidates)
+        verdict = "fastest" if chosen_name == fastest else f"{timings[chosen_name] / timings[fastest]:.2f}x the fastest"
+        print(f"{scenario:<22}{row}{planned * 1000:>15.2f} ms  {chosen_name} ({verdict})")
+
+
+def parallel_benchmark(n_employees: int, n_departments: int, worker_counts: List[int]) -> None:
+    rng = np.random.default_rng(0)
+    employee_department_ids = rng.integers(0, n_departments, size=n_employees)
+    department_ids = rng.permutation(n_departments)
+
+    baseline = timed(lambda: columnar_join.hash_join(employee_department_ids, department_ids))
+    print(f"{n_employees:,} employees x {n_departments:,} departments, {os.cpu_count()} CPUs")
+    print(f"{'algorithm':<28}{'seconds':>10}{'speedup':>10}")
+    print(f"{'columnar hash join':<28}{baseline:>10.3f}{1:>9.1f}x")
+    for workers in worker_counts:
+        elapsed = timed(lambda: parallel_join.parallel_hash_join(employee_department_ids, department_ids, workers))
+        print(f"{f'parallel ({workers} workers)':<28}{elapsed:>10.3f}{baseline / elapsed:>9.1f}x")
+
+
+if __name__ == "__main__":
+    # the cases are lambdas, so the worker processes have to be forked
+    multiprocessing.set_start_method("fork")
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("benchmark", choices=list(DEFAULT_SIZES))
+    parser.add_argument("--employees", type=int, default=None, help="default depends on the benchmark (see above)")
+    parser.add_argument("--departments", type=int, default=None, help="default depends on the benchmark (see above)")
+    parser.add_argument("--budget", type=int, default=100_000, help="max departments held in memory by Grace")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32], help="worker counts to run")
+    args = parser.parse_args()
+
+    n_employees = args.employees or DEFAULT_SIZES[args.benchmark][0]
+    n_departments = args.departments or DEFAULT_SIZES[args.benchmark][1]
+    if args.benchmark == "grace":
+        grace_benchmark(n_employees, n_departments, args.budget)
+    elif args.benchmark == "columnar":
+        columnar_benchmark(n_employees, n_departments)
+    elif args.benchmark == "streaming":
+        streaming_benchmark(n_employees, n_departments)
+    elif args.benchmark == "nested":
+        nested_benchmark(n_employees, n_departments)
+    elif args.benchmark == "planner":
+        planner_benchmark(n_employees, n_departments)
+    elif args.benchmark == "parallel":
+        parallel_benchmark(n_employees, n_departments, args.workers)
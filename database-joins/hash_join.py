@@ -26,8 +26,14 @@ Example:
 In this example, we will create two tables, `employees` and `departments`, and join them on the `department_id` column using the Hash Join algorithm.
 """
 
-from typing import List
+import os
+import pickle
+import tempfile
+import uuid
+from collections import defaultdict
 from dataclasses import dataclass
+from itertools import chain, islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 
 @dataclass
@@ -45,36 +51,187 @@ class Department:
 
 @dataclass
 class Result:
-    employee_id: int
-    employee_name: str
+    # the employee or the department columns are None for the rows without a match of an outer join
+    employee_id: Optional[int]
+    employee_name: Optional[str]
     department_id: int
-    department_name: str
+    department_name: Optional[str]
 
     def __repr__(self) -> str:
         return f"Employee ID: {self.employee_id}, Employee Name: {self.employee_name}, Department ID: {self.department_id}, Department Name: {self.department_name}"
 
 
-def hash_join(employees: List[Employee], departments: List[Department]) -> List[Result]:
+def build_table(departments: Iterable[Department]) -> Dict[int, List[Department]]:
+    # The join key can have duplicates in the build table too, so every key maps to the list of all its rows
+    department_hash = defaultdict(list)
+    for department in departments:
+        department_hash[department.id].append(department)
+    return department_hash
+
+
+# Join types supported by `hash_join` - semi & anti return the employees, right_semi & right_anti the departments
+JOIN_TYPES = ("inner", "left", "right", "full", "semi", "anti", "right_semi", "right_anti")
+
+
+def hash_join(
+    employees: Iterable[Employee], departments: List[Department], how: str = "inner"
+) -> Union[List[Result], List[Employee], List[Department]]:
+    """
+    :param how: the join type -
+        inner - employees with their departments
+        left / right / full - outer joins, also the employees / departments / both without a match (with None columns)
+        semi / anti - employees with / without a department
+        right_semi / right_anti - departments with / without employees
+
+    Every join type is a single pass over the employees. The hash table maps every department id to the row numbers of
+    its departments, & a "matched" bitmap marks the departments which matched at least one employee during the probe.
+    The departments which didn't match (right / full / right_anti) are then read from the bitmap, instead of checking
+    every department against the employees again.
+    """
+    if how not in JOIN_TYPES:
+        raise ValueError(f"Unknown join type {how!r}, expected one of {JOIN_TYPES}")
     result = []
 
     # Build a hash table from the smaller of the two tables (departments)
-    # The hash table will store the department_id as the key and the corresponding department name as the value
-    department_hash = {department.id: department.name for department in departments}
+    # The hash table will store the department_id as the key and the row numbers of the matching departments as the
+    # value (the join key can have duplicates in the build table too, so multiple matching rows produce multiple results)
+    department_hash: Dict[int, List[int]] = defaultdict(list)
+    for row, department in enumerate(departments):
+        department_hash[department.id].append(row)
+    matched = bytearray(len(departments))
+    emit_pairs = how in ("inner", "left", "right", "full")
 
     # Iterate over the larger table (employees) and probe the hash table to find matching rows
-    # TODO: Need to check how this would work when joining 2 tables which have multiple matching rows
     for employee in employees:
-        department_name = department_hash.get(employee.department_id)
-        if department_name:
-            result.append(
-                Result(
-                    employee.id, employee.name, employee.department_id, department_name
-                )
-            )
+        rows = department_hash.get(employee.department_id)
+        if how == "semi" or how == "anti":
+            if bool(rows) == (how == "semi"):
+                result.append(employee)
+            continue
+        if not rows:
+            if how == "left" or how == "full":
+                result.append(Result(employee.id, employee.name, employee.department_id, None))
+            continue
+        for row in rows:
+            matched[row] = 1
+            if emit_pairs:
+                department = departments[row]
+                result.append(Result(employee.id, employee.name, employee.department_id, department.name))
+
+    # The departments without a match, from the bitmap
+    if how == "right" or how == "full":
+        for department, is_matched in zip(departments, matched):
+            if not is_matched:
+                result.append(Result(None, None, department.id, department.name))
+    elif how == "right_semi" or how == "right_anti":
+        keep = 1 if how == "right_semi" else 0
+        result = [department for department, is_matched in zip(departments, matched) if is_matched == keep]
 
     return result
 
 
+# How many times a partition which still doesn't fit in memory is partitioned again
+MAX_LEVELS = 3
+
+
+def partition_rows(
+    rows: Iterable[Tuple], key_index: int, num_partitions: int, level: int, directory: str, batch_size: int = 10_000
+) -> List[str]:
+    """Write the rows (as tuples) to `num_partitions` files on the hash of the key. Returns the file paths."""
+    paths = [os.path.join(directory, f"partition-{level}-{uuid.uuid4().hex}") for _ in range(num_partitions)]
+    files = [open(path, "wb") for path in paths]
+    buffers: List[List[Tuple]] = [[] for _ in range(num_partitions)]
+    try:
+        for row in rows:
+            # the level is part of the hash, so repartitioning a partition actually splits it
+            index = hash((level, row[key_index])) % num_partitions
+            buffer = buffers[index]
+            buffer.append(row)
+            if len(buffer) >= batch_size:
+                pickle.dump(buffer, files[index], protocol=pickle.HIGHEST_PROTOCOL)
+                buffer.clear()
+        for file, buffer in zip(files, buffers):
+            if buffer:
+                pickle.dump(buffer, file, protocol=pickle.HIGHEST_PROTOCOL)
+    finally:
+        for file in files:
+            file.close()
+    return paths
+
+
+def drain(rows: List) -> Iterator:
+    """Yield the rows of the list in order, removing each one from the list, so it can be freed once it is consumed."""
+    rows.reverse()
+    while rows:
+        yield rows.pop()
+
+
+def read_partition(path: str) -> Iterator[Tuple]:
+    with open(path, "rb") as file:
+        while True:
+            try:
+                yield from pickle.load(file)
+            except EOFError:
+                return
+
+
+def grace_hash_join(
+    employees: Iterable[Employee],
+    departments: Iterable[Department],
+    max_build_rows: int = 1_000_000,
+    num_partitions: int = 16,
+    directory: Optional[str] = None,
+    level: int = 0,
+) -> Iterator[Result]:
+    """
+    Grace Hash Join - a hash join which holds at most `max_build_rows` departments in memory.
+
+    When the build table doesn't fit in memory, both tables are partitioned on the hash of the join key into
+    `num_partitions` temporary files. Rows with the same key always land in the same partition, so each pair of
+    partitions can be joined independently, with a build table of only ~1/num_partitions of the rows.
+
+    1. Read the build table until it exceeds the memory budget. If it doesn't, this is just a regular hash join.
+    2. Otherwise, write both the build & the probe table to partition files, in batches of `max_build_rows //
+       num_partitions` rows per partition. The rows already read are removed from memory as they are partitioned, so
+       the rows read & the batches together stay within the budget.
+    3. Hash join every (build partition, probe partition) pair. If a build partition still exceeds the budget, it is
+       partitioned again using a different hash function, up to `MAX_LEVELS` times (a single key with more rows than
+       the budget can't be split any further).
+
+    Every row is written & read once per level, so the extra I/O is O(n + m) per level. Both inputs can be iterators &
+    the results are yielded, so neither table nor the result has to fit in memory.
+    """
+    departments = iter(departments)
+    build = list(islice(departments, max_build_rows + 1))
+    if len(build) <= max_build_rows or level >= MAX_LEVELS:
+        build.extend(departments)
+        department_hash = build_table(build)
+        for employee in employees:
+            for department in department_hash.get(employee.department_id, ()):
+                yield Result(employee.id, employee.name, employee.department_id, department.name)
+        return
+
+    # all the partition buffers together hold at most `max_build_rows` rows
+    batch_size = max(1, max_build_rows // num_partitions)
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        build_rows = ((department.id, department.name) for department in chain(drain(build), departments))
+        build_paths = partition_rows(build_rows, 0, num_partitions, level, tmp, batch_size)
+        probe_rows = ((employee.id, employee.name, employee.department_id) for employee in employees)
+        probe_paths = partition_rows(probe_rows, 2, num_partitions, level, tmp, batch_size)
+
+        for build_path, probe_path in zip(build_paths, probe_paths):
+            yield from grace_hash_join(
+                (Employee(*row) for row in read_partition(probe_path)),
+                (Department(*row) for row in read_partition(build_path)),
+                max_build_rows,
+                num_partitions,
+                tmp,
+                level + 1,
+            )
+            os.remove(build_path)
+            os.remove(probe_path)
+
+
 if __name__ == "__main__":
     # Create sample data for employees and departments
     employees = [
@@ -97,3 +254,24 @@ if __name__ == "__main__":
     # Print the result
     for record in result:
         print(record)
+
+    # Duplicate keys in the build table join with every matching row & empty names aren't dropped
+    departments.append(Department(id=1, name="Platform"))
+    departments.append(Department(id=5, name=""))
+    employees.append(Employee(id=5, name="Eve", department_id=5))
+    result = hash_join(employees, departments)
+    print()
+    for record in result:
+        print(record)
+
+    # Outer, semi & anti joins
+    employees.append(Employee(id=6, name="Frank", department_id=9))
+    for how in JOIN_TYPES[1:]:
+        print(f"\n{how}:")
+        for record in hash_join(employees, departments, how):
+            print(record)
+    employees.pop()
+
+    # Join again, with a tiny memory budget so that both tables are partitioned to disk
+    spilled = grace_hash_join(employees, departments, max_build_rows=2, num_partitions=2)
+    assert sorted(spilled, key=repr) == sorted(result, key=repr)
@@ -0,0 +1,141 @@
+"""
+Iterator Joins (Volcano Model)
+==============================
+
+`nested_loop_join`, `merge_join` & `hash_join` build & return the whole `List[Result]`, so both inputs & the output have
+to fit in memory before the first row is consumed.
+
+In the Volcano (iterator) model, which most databases use to execute a query plan, every operator is an iterator which
+pulls rows from its children one at a time & yields its own rows lazily. Here every operator is a generator -
+1. scan - yields the rows of a table (any iterable - a list, a file, a cursor, ...)
+2. filter_rows - yields the rows matching a predicate
+3. nested_loop_join / hash_join / merge_join - yield (left row, right row) for every match
+4. project - yields a new row computed from every row
+
+A query plan is a pipeline of these, eg - `project(hash_join(filter_rows(scan(employees), ...), scan(departments)))`.
+Only the rows "in flight" (& the build side of the hash join) are in memory at any time, & the first result is
+available as soon as the first match is found.
+
+Example:
+In this example, we will join the `employees` & `departments` tables on `department_id`, keeping only some employees.
+"""
+
+from collections import defaultdict
+from typing import Any, Callable, Iterable, Iterator, List, Tuple, TypeVar
+
+Row = TypeVar("Row")
+Left = TypeVar("Left")
+Right = TypeVar("Right")
+Key = Callable[[Any], Any]
+
+
+def scan(table: Iterable[Row]) -> Iterator[Row]:
+    yield from table
+
+
+def filter_rows(rows: Iterable[Row], predicate: Callable[[Row], bool]) -> Iterator[Row]:
+    for row in rows:
+        if predicate(row):
+            yield row
+
+
+def project(rows: Iterable[Row], projection: Callable[[Row], Any]) -> Iterator[Any]:
+    for row in rows:
+        yield projection(row)
+
+
+def nested_loop_join(
+    outer: Iterable[Left], inner: Iterable[Right], outer_key: Key, inner_key: Key
+) -> Iterator[Tuple[Left, Right]]:
+    """
+    The inner side is scanned once per outer row, so it is materialized (once) - the outer side is streamed.
+    """
+    inner_rows = list(inner)
+    for outer_row in outer:
+        key = outer_key(outer_row)
+        for inner_row in inner_rows:
+            if inner_key(inner_row) == key:
+                yield outer_row, inner_row
+
+
+def hash_join(
+    probe: Iterable[Left], build: Iterable[Right], probe_key: Key, build_key: Key
+) -> Iterator[Tuple[Left, Right]]:
+    """
+    The build side is read into the hash table before the first row is yielded (a "blocking" step), the probe side is
+    streamed.
+    """
+    table = defaultdict(list)
+    for row in build:
+        table[build_key(row)].append(row)
+    for row in probe:
+        for match in table.get(probe_key(row), ()):
+            yield row, match
+
+
+def merge_join(
+    left: Iterable[Left], right: Iterable[Right], left_key: Key, right_key: Key
+) -> Iterator[Tuple[Left, Right]]:
+    """
+    Both inputs must already be sorted on the key. Only the current run of equal keys on the right side is buffered, so
+    every left row with that key can be joined with all of them (duplicate keys on both sides).
+    """
+    right = iter(right)
+    sentinel = object()
+    right_row = next(right, sentinel)
+    run: List[Right] = []
+    run_key = sentinel
+
+    for left_row in left:
+        key = left_key(left_row)
+        if run_key is sentinel or key != run_key:
+            # skip the right rows with smaller keys
+            while right_row is not sentinel and right_key(right_row) < key:
+                right_row = next(right, sentinel)
+            # buffer the run of right rows with this key
+            run, run_key = [], key
+            while right_row is not sentinel and right_key(right_row) == key:
+                run.append(right_row)
+                right_row = next(right, sentinel)
+        for match in run:
+            yield left_row, match
+
+
+if __name__ == "__main__":
+    from operator import attrgetter
+
+    from hash_join import Department, Employee, Result
+
+    employees = [
+        Employee(id=1, name="Alice", department_id=1),
+        Employee(id=2, name="Bob", department_id=2),
+        Employee(id=3, name="Charlie", department_id=1),
+        Employee(id=4, name="David", department_id=3),
+    ]
+
+    departments = [
+        Department(id=1, name="Engineering"),
+        Department(id=2, name="Sales"),
+        Department(id=3, name="Marketing"),
+        Department(id=1, name="Platform"),
+    ]
+
+    def to_result(match: Tuple[Employee, Department]) -> Result:
+        employee, department = match
+        return Result(employee.id, employee.name, department.id, department.name)
+
+    employee_key, department_key = attrgetter("department_id"), attrgetter("id")
+    joins = {
+        "nested loop": lambda rows: nested_loop_join(rows, scan(departments), employee_key, department_key),
+        "hash": lambda rows: hash_join(rows, scan(departments), employee_key, department_key),
+        # merge join needs both inputs sorted on the key
+        "merge": lambda rows: merge_join(
+            sorted(rows, key=employee_key), sorted(departments, key=department_key), employee_key, department_key
+        ),
+    }
+    for name, join in joins.items():
+        # scan -> filter -> join -> project
+        pipeline = project(join(filter_rows(scan(employees), lambda employee: employee.id != 2)), to_result)
+        print(f"{name}:")
+        for record in pipeline:
+            print(record)
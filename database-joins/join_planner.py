@@ -0,0 +1,179 @@
+"""
+Join Planner
+============
+
+Like a database's query planner, `join(left, right, key)` picks the join algorithm instead of the caller -
+1. Gather cheap statistics about both inputs (`collect_stats`) -
+   a. row count
+   b. whether the rows are already sorted on the key (a single pass, which stops at the first row out of order)
+   c. number of distinct keys, estimated from a random sample of s rows with the Haas-Stokes (Duj1) estimator, which
+      PostgreSQL's ANALYZE also uses - `s * d / (s - f1 + f1 * s / n)`, where d is the number of distinct keys in the
+      sample & f1 the number of keys seen exactly once. If every sampled key is unique, the estimate is n.
+2. Estimate the cost of every candidate (`plan_join`) -
+   a. nested loop - every pair of rows is compared
+   b. hash join, building the hash table on either side - adding a new key to the hash table is ~5x as expensive as
+      probing it, so the side with fewer distinct keys is usually the better build side
+   c. merge join - sort the sides which aren't sorted yet, then merge
+3. Log the chosen plan & execute it with the iterator joins (`iterator_joins.py`).
+
+The costs are in (approximate) microseconds per row, measured for the Python implementations in this directory, the
+same way PostgreSQL's `seq_page_cost`, `cpu_tuple_cost` etc. are relative costs of its operations.
+
+Example:
+In this example, we will join `employees` & `departments` of different sizes & look at the chosen plans.
+"""
+
+import logging
+import math
+import random
+from collections import Counter
+from dataclasses import dataclass, field
+from operator import attrgetter, itemgetter
+from typing import Any, Callable, Dict, Iterator, Optional, Sequence, Tuple, Union
+
+import iterator_joins
+
+logger = logging.getLogger(__name__)
+
+Key = Union[str, Callable[[Any], Any]]
+
+# Cost (~microseconds) of
+NESTED_LOOP_PAIR_COST = 0.05  # comparing a pair of rows in the nested loop join
+HASH_BUILD_ROW_COST = 0.1  # appending a row to its key's list in the hash table
+HASH_BUILD_KEY_COST = 0.7  # adding a new key (& its list) to the hash table
+HASH_PROBE_COST = 0.15  # looking up a row in the hash table
+SORT_COST = 0.035  # per n * log2(n) of sorting n rows
+MERGE_COST = 0.26  # per row of the merge step
+OUTPUT_COST = 0.3  # per result row (the same for every algorithm, but part of the estimate)
+SWAP_COST = 0.15  # per result row, to swap the (probe, build) pairs back to (left, right) when building on the left
+
+
+@dataclass
+class TableStats:
+    rows: int
+    is_sorted: bool
+    distinct: float  # estimated number of distinct keys
+
+
+def key_function(key: Key) -> Callable[[Any], Any]:
+    return attrgetter(key) if isinstance(key, str) else key
+
+
+def is_sorted(rows: Sequence, key: Callable[[Any], Any]) -> bool:
+    previous = None
+    for i, row in enumerate(rows):
+        current = key(row)
+        if i and current < previous:
+            return False
+        previous = current
+    return True
+
+
+def collect_stats(rows: Sequence, key: Key, sample_size: int = 1000, seed: int = 0) -> TableStats:
+    key = key_function(key)
+    n = len(rows)
+    if n == 0:
+        return TableStats(rows=0, is_sorted=True, distinct=0)
+
+    sample = [key(row) for row in random.Random(seed).sample(rows, min(sample_size, n))]
+    frequencies = Counter(sample)
+    s, d = len(sample), len(frequencies)
+    seen_once = sum(1 for count in frequencies.values() if count == 1)
+    distinct = s * d / (s - seen_once + seen_once * s / n)
+    return TableStats(
+        rows=n,
+        is_sorted=is_sorted(rows, key),
+        distinct=min(max(distinct, 1.0), n),
+    )
+
+
+@dataclass
+class Plan:
+    algorithm: str  # nested_loop, hash or merge
+    build_side: Optional[str]  # left or right, for the hash join
+    cost: float
+    estimated_rows: float
+    # whether the merge join has to sort the inputs first
+    sort_left: bool = False
+    sort_right: bool = False
+    costs: Dict[str, float] = field(default_factory=dict)  # of every candidate
+
+    def __str__(self) -> str:
+        algorithm = f"hash (build {self.build_side})" if self.algorithm == "hash" else self.algorithm
+        candidates = ", ".join(f"{name}={cost:,.0f}" for name, cost in sorted(self.costs.items(), key=itemgetter(1)))
+        return f"{algorithm}, cost={self.cost:,.0f}, rows={self.estimated_rows:,.0f} ({candidates})"
+
+
+def sort_cost(stats: TableStats) -> float:
+    if stats.is_sorted or stats.rows < 2:
+        return 0.0
+    return SORT_COST * stats.rows * math.log2(stats.rows)
+
+
+def build_cost(stats: TableStats) -> float:
+    return HASH_BUILD_ROW_COST * stats.rows + HASH_BUILD_KEY_COST * stats.distinct
+
+
+def plan_join(left: TableStats, right: TableStats) -> Plan:
+    # the usual equi-join estimate - every key of the side with fewer distinct keys matches the other side
+    estimated_rows = left.rows * right.rows / max(left.distinct, right.distinct, 1.0)
+    output = OUTPUT_COST * estimated_rows
+    costs = {
+        "nested_loop": NESTED_LOOP_PAIR_COST * left.rows * right.rows + output,
+        "hash_build_left": build_cost(left) + HASH_PROBE_COST * right.rows + output + SWAP_COST * estimated_rows,
+        "hash_build_right": build_cost(right) + HASH_PROBE_COST * left.rows + output,
+        "merge": sort_cost(left) + sort_cost(right) + MERGE_COST * (left.rows + right.rows) + output,
+    }
+    best = min(costs, key=costs.get)
+    algorithm, build_side = ("hash", best.rsplit("_", 1)[1]) if best.startswith("hash") else (best, None)
+    return Plan(algorithm, build_side, costs[best], estimated_rows, not left.is_sorted, not right.is_sorted, costs)
+
+
+def execute(
+    plan: Plan, left: Sequence, right: Sequence, left_key: Callable, right_key: Callable
+) -> Iterator[Tuple]:
+    """Yield (left row, right row) of every match, whichever side the algorithm is driven by."""
+    if plan.algorithm == "nested_loop":
+        return iterator_joins.nested_loop_join(left, right, left_key, right_key)
+    if plan.algorithm == "merge":
+        # sorting copies, so the caller's lists aren't modified
+        left = sorted(left, key=left_key) if plan.sort_left else left
+        right = sorted(right, key=right_key) if plan.sort_right else right
+        return iterator_joins.merge_join(left, right, left_key, right_key)
+    if plan.build_side == "right":
+        return iterator_joins.hash_join(left, right, left_key, right_key)
+    # the right side probes the hash table of the left side, so the pairs are (right, left)
+    matches = iterator_joins.hash_join(right, left, right_key, left_key)
+    return ((left_row, right_row) for right_row, left_row in matches)
+
+
+def join(
+    left: Sequence, right: Sequence, key: Key, right_key: Optional[Key] = None, sample_size: int = 1000
+) -> Iterator[Tuple]:
+    """
+    Equi-join `left` & `right` on `key` (an attribute name or a function of the row), or on `key` of the left rows &
+    `right_key` of the right rows. Yields (left row, right row) of every match.
+    """
+    left_key, right_key = key_function(key), key_function(right_key if right_key is not None else key)
+    left_stats = collect_stats(left, left_key, sample_size)
+    right_stats = collect_stats(right, right_key, sample_size)
+    plan = plan_join(left_stats, right_stats)
+    logger.info("join plan: %s | left: %s | right: %s", plan, left_stats, right_stats)
+    return execute(plan, left, right, left_key, right_key)
+
+
+if __name__ == "__main__":
+    from hash_join import Department, Employee
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    def employees(n: int, n_departments: int):
+        return [Employee(id=i, name=f"employee-{i}", department_id=i % n_departments) for i in range(n)]
+
+    def departments(n: int):
+        return [Department(id=i, name=f"department-{i}") for i in range(n)]
+
+    for n_employees, n_departments in [(5, 3), (100_000, 10), (10, 100_000), (100_000, 100_000)]:
+        print(f"\n{n_employees:,} employees x {n_departments:,} departments")
+        matches = join(employees(n_employees, n_departments), departments(n_departments), "department_id", "id")
+        print(f"{sum(1 for _ in matches):,} matches")
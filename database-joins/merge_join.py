@@ -27,9 +27,9 @@ Pseudocode:
 2. Initialize pointers i and j for the left and right tables.
 3. While i < len(left) and j < len(right):
    a. If left[i].key == right[j].key:
-      - Append the joined result to the output.
-      - Increment j to process the next row in the right table.
-      - If right[j].key still matches left[i].key, repeat this step.
+      - Find the runs of rows with this key on both sides - left[i:i2] & right[j:j2].
+      - Append the joined result of every pair of rows from the 2 runs to the output.
+      - Set i = i2 & j = j2.
    b. If left[i].key < right[j].key:
       - Increment i to process the next row in the left table.
    c. If right[j].key < left[i].key:
@@ -37,12 +37,29 @@ Pseudocode:
 4. Repeat until all rows are processed.
 
 
+Many-to-Many Keys:
+The join key can repeat on both sides (eg - 2 departments with the same id). So instead of a single row, a whole "run"
+of rows with the same key is taken from each side, & every row of the left run is joined with every row of the right
+run. Only the current run of the right side is buffered.
+
+External Sort:
+When a table doesn't fit in memory, it is sorted with an external merge sort -
+1. Read `max_rows_in_memory` rows at a time, sort them & write them to a temporary file (a sorted "run").
+2. Merge all the runs with a k-way merge (`heapq.merge`), which only holds one row per run in memory.
+If the tables are already sorted on the join key (eg - read from an index), `presorted=True` skips sorting altogether.
+
 Example:
 In this example, we will create two tables, `employees` and `departments`, and join them on the `department_id` column using the Merge Join algorithm.
 """
 
-from typing import List
+import heapq
+import os
+import pickle
+import tempfile
 from dataclasses import dataclass
+from itertools import groupby, islice
+from operator import attrgetter
+from typing import Callable, Iterable, Iterator, List
 
 
 @dataclass
@@ -69,34 +86,89 @@ class Result:
         return f"Employee ID: {self.employee_id}, Employee Name: {self.employee_name}, Department ID: {self.department_id}, Department Name: {self.department_name}"
 
 
+def write_run(rows: List, directory: str, batch_size: int = 10_000) -> str:
+    file_descriptor, path = tempfile.mkstemp(dir=directory, suffix=".run")
+    with os.fdopen(file_descriptor, "wb") as file:
+        for start in range(0, len(rows), batch_size):
+            pickle.dump(rows[start : start + batch_size], file, protocol=pickle.HIGHEST_PROTOCOL)
+    return path
+
+
+def read_run(path: str) -> Iterator:
+    with open(path, "rb") as file:
+        while True:
+            try:
+                yield from pickle.load(file)
+            except EOFError:
+                return
+
+
+def external_sort(rows: Iterable, key: Callable, max_rows_in_memory: int = 1_000_000) -> Iterator:
+    """
+    Yield the rows sorted on the key, holding at most `max_rows_in_memory` rows in memory. Doesn't modify the input.
+    """
+    rows = iter(rows)
+    chunk = list(islice(rows, max_rows_in_memory + 1))
+    if len(chunk) <= max_rows_in_memory:
+        # fits in memory
+        yield from sorted(chunk, key=key)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        runs = []
+        while chunk:
+            chunk.sort(key=key)
+            runs.append(write_run(chunk, directory))
+            chunk = list(islice(rows, max_rows_in_memory))
+        # `heapq.merge` is stable across runs, so rows with equal keys keep their input order
+        yield from heapq.merge(*(read_run(path) for path in runs), key=key)
+
+
+def iter_merge_join(
+    employees: Iterable[Employee],
+    departments: Iterable[Department],
+    presorted: bool = False,
+    max_rows_in_memory: int = 1_000_000,
+) -> Iterator[Result]:
+    employee_key, department_key = attrgetter("department_id"), attrgetter("id")
+    if not presorted:
+        employees = external_sort(employees, employee_key, max_rows_in_memory)
+        departments = external_sort(departments, department_key, max_rows_in_memory)
+
+    # runs of rows with the same key, in the order of the key
+    employee_runs = groupby(employees, key=employee_key)
+    department_runs = groupby(departments, key=department_key)
+    employee_run = next(employee_runs, None)
+    department_run = next(department_runs, None)
+
+    while employee_run is not None and department_run is not None:
+        (employee_id, employees_with_key), (department_id, departments_with_key) = employee_run, department_run
+        if employee_id < department_id:
+            employee_run = next(employee_runs, None)
+        elif department_id < employee_id:
+            department_run = next(department_runs, None)
+        else:
+            # every employee of the run is joined with every department of the run
+            matching_departments = list(departments_with_key)
+            for employee in employees_with_key:
+                for department in matching_departments:
+                    yield Result(
+                        employee_id=employee.id,
+                        employee_name=employee.name,
+                        department_id=department.id,
+                        department_name=department.name,
+                    )
+            employee_run = next(employee_runs, None)
+            department_run = next(department_runs, None)
+
+
 def merge_join(
-    employees: List[Employee], departments: List[Department]
+    employees: Iterable[Employee],
+    departments: Iterable[Department],
+    presorted: bool = False,
+    max_rows_in_memory: int = 1_000_000,
 ) -> List[Result]:
-    # Sort employees based on department_id
-    employees.sort(key=lambda x: x.department_id)
-    # Sort departments based on id
-    departments.sort(key=lambda x: x.id)
-
-    # Perform the merge operation
-    result = []
-    i, j = 0, 0
-
-    while i < len(departments) and j < len(employees):
-        if departments[i].id == employees[j].department_id:
-            result.append(
-                Result(
-                    employee_id=employees[j].id,
-                    employee_name=employees[j].name,
-                    department_id=departments[i].id,
-                    department_name=departments[i].name,
-                )
-            )
-            j += 1
-        elif departments[i].id < employees[j].department_id:
-            i += 1
-        else:
-            j += 1
-    return result
+    return list(iter_merge_join(employees, departments, presorted, max_rows_in_memory))
 
 
 if __name__ == "__main__":
@@ -121,3 +193,16 @@ if __name__ == "__main__":
     # Print the result
     for record in result:
         print(record)
+
+    # Duplicate keys on both sides - every matching pair is joined. The input lists aren't modified.
+    departments.append(Department(id=1, name="Platform"))
+    employees.append(Employee(id=5, name="Eve", department_id=1))
+    before = list(employees), list(departments)
+    result = merge_join(employees, departments)
+    assert (employees, departments) == before
+    print()
+    for record in result:
+        print(record)
+
+    # With a tiny memory budget, both tables are sorted using an external merge sort
+    assert merge_join(employees, departments, max_rows_in_memory=2) == result
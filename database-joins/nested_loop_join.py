@@ -14,12 +14,27 @@ Time Complexity:
 
 Space Complexity: O(1)
 
+Block Nested Loop Join:
+The inner table is scanned once for every outer row, which is very expensive when scanning it means reading it from disk.
+Instead, the outer table is read in blocks of `block_size` rows which fit in memory (MySQL's "join buffer"), & the inner
+table is scanned once per block - n / block_size scans instead of n. Every inner row is matched against all the rows of
+the block at once, by looking up its key in a hash table of the block.
+
+Index Nested Loop Join:
+If the inner table has an index on the join key, every outer row looks up its matches in the index instead of scanning
+the inner table - O(n * log m) with a sorted (B-tree like) index, O(n) with a hash index. The index is built once & reused
+by every join.
+
 Example:
 In this example, we will create two tables, `employees` and `departments`, and join them on the `department_id` column using the Nested Loop Join algorithm.
 """
 
-from typing import List
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
 from dataclasses import dataclass
+from itertools import islice
+from operator import itemgetter
+from typing import Dict, Iterable, List, Tuple
 
 
 @dataclass
@@ -57,6 +72,65 @@ def nested_loop_join(
     return result
 
 
+def block_nested_loop_join(
+    employees: Iterable[Employee], departments: List[Department], block_size: int = 1000
+) -> List[Result]:
+    result = []
+    employees = iter(employees)
+    while True:
+        block = list(islice(employees, block_size))
+        if not block:
+            return result
+        # (position in the block, employee) of the employees of the block, by department id
+        block_hash: Dict[int, List[Tuple[int, Employee]]] = defaultdict(list)
+        for position, employee in enumerate(block):
+            block_hash[employee.department_id].append((position, employee))
+        # a single scan of the inner table per block
+        matches = []
+        for department in departments:
+            for position, employee in block_hash.get(department.id, ()):
+                matches.append((position, Result(employee.id, employee.name, department.id, department.name)))
+        # same order as the tuple-at-a-time join (stable sort, by employee)
+        matches.sort(key=itemgetter(0))
+        result.extend(record for _, record in matches)
+
+
+class HashIndex:
+    """Department id -> departments. O(1) lookups, only for equality."""
+
+    def __init__(self, departments: Iterable[Department]):
+        self.index: Dict[int, List[Department]] = defaultdict(list)
+        for department in departments:
+            self.index[department.id].append(department)
+
+    def lookup(self, key: int) -> List[Department]:
+        return self.index.get(key, [])
+
+
+class SortedIndex:
+    """Departments sorted by id, searched with binary search. O(log m) lookups, also supports range scans."""
+
+    def __init__(self, departments: Iterable[Department]):
+        self.departments = sorted(departments, key=lambda department: department.id)
+        self.keys = [department.id for department in self.departments]
+
+    def lookup(self, key: int) -> List[Department]:
+        return self.departments[bisect_left(self.keys, key) : bisect_right(self.keys, key)]
+
+    def range(self, low: int, high: int) -> List[Department]:
+        """Departments with low <= id <= high"""
+        return self.departments[bisect_left(self.keys, low) : bisect_right(self.keys, high)]
+
+
+def index_nested_loop_join(employees: Iterable[Employee], index) -> List[Result]:
+    """`index` is a prebuilt `HashIndex` or `SortedIndex` of the departments on the join key."""
+    result = []
+    for employee in employees:
+        for department in index.lookup(employee.department_id):
+            result.append(Result(employee.id, employee.name, department.id, department.name))
+    return result
+
+
 if __name__ == "__main__":
     # Create sample data for employees and departments
     employees = [
@@ -79,3 +153,8 @@ if __name__ == "__main__":
     # Print the result
     for record in result:
         print(record)
+
+    # The other variants produce the same result
+    assert block_nested_loop_join(employees, departments, block_size=3) == result
+    for index in [HashIndex(departments), SortedIndex(departments)]:
+        assert index_nested_loop_join(employees, index) == result
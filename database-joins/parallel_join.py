@@ -0,0 +1,155 @@
+"""
+Parallel Hash Join
+==================
+
+A single hash join uses a single CPU core. The radix partitioned hash join splits the work into independent pieces -
+1. Partition - both tables are partitioned on the lowest `bits` bits of the join key (the "radix") into P = 2^bits
+   partitions. Rows with the same key always land in the same partition, so partition i of the left table only has
+   to be joined with partition i of the right table.
+2. Join - every pair of partitions is hash joined by a worker process, on the remaining bits of the key (`key >> bits`).
+   All the keys of a partition have the same lowest bits, so 2 keys are equal iff their remaining bits are, & dense
+   keys (eg - ids) stay dense within a partition. Each partition is ~1/P of the table, so its hash table is small
+   enough to stay in the CPU cache, which makes the probes faster too.
+
+Keys which aren't integers are first mapped to integer codes with `np.unique`. Keys whose lowest bits are skewed (eg -
+only even numbers) would make the partitions uneven.
+
+The partitioned key columns are written to shared memory (`multiprocessing.shared_memory`) once, & every worker maps
+them into NumPy arrays without copying. So only the partition number is sent to a worker & only the matching index
+arrays are sent back - no rows are pickled.
+
+Partitioning is vectorized in the main process - with up to 16 partition bits, the partition numbers are 16 bit
+integers, which `np.argsort` sorts with a (stable) radix sort in O(n).
+
+Example:
+In this example, we will join 1M employees with 100K departments using 4 worker processes.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from columnar_join import hash_join
+
+
+def integer_keys(left_keys: np.ndarray, right_keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    if np.issubdtype(left_keys.dtype, np.integer) and np.issubdtype(right_keys.dtype, np.integer):
+        return left_keys.astype(np.int64, copy=False), right_keys.astype(np.int64, copy=False)
+    # the same code for the same key in both tables
+    _, codes = np.unique(np.concatenate([left_keys, right_keys]), return_inverse=True)
+    return codes[: len(left_keys)], codes[len(left_keys) :]
+
+
+def partition(keys: np.ndarray, bits: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns the row numbers grouped by partition & where every partition starts (& ends) in them."""
+    # 16 bit ids are radix sorted, wider ones would be truncated by uint16
+    ids = (keys & ((1 << bits) - 1)).astype(np.uint16 if bits <= 16 else np.int64)
+    rows = np.argsort(ids, kind="stable")
+    offsets = np.zeros((1 << bits) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(ids, minlength=1 << bits), out=offsets[1:])
+    return rows, offsets
+
+
+class SharedColumns:
+    """NumPy arrays copied into shared memory blocks, which worker processes can map by name."""
+
+    def __init__(self, columns: Dict[str, np.ndarray]):
+        self.blocks: List[shared_memory.SharedMemory] = []
+        # name -> (shared memory block name, dtype, length), to attach in the workers
+        self.spec: Dict[str, Tuple[str, str, int]] = {}
+        for name, column in columns.items():
+            block = shared_memory.SharedMemory(create=True, size=max(column.nbytes, 1))
+            np.ndarray(column.shape, dtype=column.dtype, buffer=block.buf)[:] = column
+            self.blocks.append(block)
+            self.spec[name] = (block.name, column.dtype.str, len(column))
+
+    def close(self) -> None:
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+
+
+# the shared columns & the number of partition bits, attached once per worker process
+_worker_blocks: List[shared_memory.SharedMemory] = []
+_worker_columns: Dict[str, np.ndarray] = {}
+_worker_bits = 0
+
+
+def attach(spec: Dict[str, Tuple[str, str, int]], bits: int) -> None:
+    global _worker_bits
+    _worker_bits = bits
+    for name, (block_name, dtype, length) in spec.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        _worker_blocks.append(block)
+        _worker_columns[name] = np.ndarray((length,), dtype=np.dtype(dtype), buffer=block.buf)
+
+
+def join_partition(partition_number: int) -> Tuple[np.ndarray, np.ndarray]:
+    columns = _worker_columns
+    left_start, left_end = columns["left_offsets"][partition_number : partition_number + 2]
+    right_start, right_end = columns["right_offsets"][partition_number : partition_number + 2]
+    left_rows = columns["left_rows"][left_start:left_end]
+    right_rows = columns["right_rows"][right_start:right_end]
+    left_indices, right_indices = hash_join(
+        columns["left_keys"][left_rows] >> _worker_bits, columns["right_keys"][right_rows] >> _worker_bits
+    )
+    # back to row numbers of the whole tables
+    return left_rows[left_indices], right_rows[right_indices]
+
+
+def parallel_hash_join(
+    left_keys: np.ndarray, right_keys: np.ndarray, workers: Optional[int] = None, partition_bits: Optional[int] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Same result as `columnar_join.hash_join` (the matching row indices of both tables), though not in the same order.
+
+    :param partition_bits: 2^bits partitions. Defaults to ~8 partitions per worker, so that a slow partition doesn't
+        hold up the others.
+    """
+    workers = workers or os.cpu_count() or 1
+    bits = partition_bits if partition_bits is not None else max(int(np.ceil(np.log2(workers * 8))), 1)
+    left_keys, right_keys = integer_keys(left_keys, right_keys)
+    left_rows, left_offsets = partition(left_keys, bits)
+    right_rows, right_offsets = partition(right_keys, bits)
+
+    shared = SharedColumns(
+        {
+            "left_keys": left_keys,
+            "right_keys": right_keys,
+            "left_rows": left_rows,
+            "right_rows": right_rows,
+            "left_offsets": left_offsets,
+            "right_offsets": right_offsets,
+        }
+    )
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=attach, initargs=(shared.spec, bits)) as executor:
+            results = list(executor.map(join_partition, range(1 << bits)))
+    finally:
+        shared.close()
+    return np.concatenate([left for left, _ in results]), np.concatenate([right for _, right in results])
+
+
+if __name__ == "__main__":
+    import time
+
+    rng = np.random.default_rng(0)
+    employee_department_ids = rng.integers(0, 100_000, size=1_000_000)
+    department_ids = np.arange(100_000)
+
+    start = time.perf_counter()
+    expected = hash_join(employee_department_ids, department_ids)
+    print(f"hash join: {len(expected[0]):,} matches in {time.perf_counter() - start:.2f} sec")
+
+    start = time.perf_counter()
+    result = parallel_hash_join(employee_department_ids, department_ids, workers=4)
+    print(f"parallel hash join (4 workers): {len(result[0]):,} matches in {time.perf_counter() - start:.2f} sec")
+
+    # more partitions than fit in 16 bits - keys 0 & 1 << 16 are different partitions
+    assert len(parallel_hash_join(np.array([0, 1 << 16]), np.array([0]), workers=1, partition_bits=17)[0]) == 1
+
+    # the same matches, in a different order
+    assert sorted(zip(*map(np.ndarray.tolist, expected))) == sorted(zip(*map(np.ndarray.tolist, result)))
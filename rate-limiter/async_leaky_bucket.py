@@ -0,0 +1,183 @@
+"""
+Async Leaky Bucket
+==================
+
+`LeakyBucket` in `leaky-bucket.py` only keeps a counter of the bytes in the bucket - the packets themselves are never
+stored or forwarded, & every bucket needs its own thread that wakes up every `rate[1]` seconds.
+
+This version is an actual FIFO queue of packets:
+1. Arriving packets are put in a bounded `asyncio.Queue`. If the bucket doesn't have enough capacity (in bytes or in
+   number of packets), the packet overflows & is dropped.
+2. A single drain task per bucket takes packets out of the queue & hands them over to an async consumer callback at a
+   smooth rate of `rate[0] / rate[1]` bytes per second - a packet of `size` bytes takes `size / bytes_per_second`
+   seconds to "leak", instead of the bucket leaking `rate[0]` bytes in one go every `rate[1]` seconds.
+3. An empty bucket's drain task is suspended on `queue.get()`, so idle buckets cost no CPU & thousands of buckets can
+   share a single event loop.
+"""
+
+import asyncio
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class Packet:
+    def __init__(self, size: int, data: Optional[bytes] = None):
+        self.size = size  # packet size in bytes
+        self.data = data
+
+
+class AsyncLeakyBucket:
+    def __init__(
+        self,
+        bucket_size: int,
+        rate: Tuple[int, int],
+        consumer: Callable[[Packet], Awaitable[None]],
+        max_packets: int = 1000,
+    ):
+        self.bucket_size = bucket_size  # bucket size in bytes
+        self.rate = rate  # leaky rate. eg - (500, 2) implies 500 bytes every 2 seconds
+        self.bytes_per_second = rate[0] / rate[1]
+        self.consumer = consumer  # async callback to forward packets to
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_packets)
+        self.current_size = 0  # bytes currently waiting in the queue
+
+        # counters
+        self.transmitted_packets = 0
+        self.transmitted_bytes = 0
+        self.dropped_packets = 0
+        self.dropped_bytes = 0
+        self.failed_packets = 0  # packets the consumer raised an exception for
+
+        self.transmission_task: Optional[asyncio.Task] = None
+
+    @property
+    def queue_depth(self) -> int:
+        return self.queue.qsize()
+
+    def add_packet(self, packet: Packet) -> bool:
+        if (self.current_size + packet.size) > self.bucket_size or self.queue.full():
+            self.dropped_packets += 1
+            self.dropped_bytes += packet.size
+            return False
+
+        self.queue.put_nowait(packet)
+        self.current_size += packet.size
+        return True
+
+    async def transmit(self):
+        loop = asyncio.get_running_loop()
+        # time at which the previous packet has completely leaked out of the bucket
+        next_send_time = loop.time()
+        while True:
+            packet = await self.queue.get()
+
+            # an idle bucket doesn't accumulate credit, so it can't send a burst after waking up
+            now = loop.time()
+            next_send_time = max(next_send_time, now)
+            if next_send_time > now:
+                await asyncio.sleep(next_send_time - now)
+            next_send_time += packet.size / self.bytes_per_second
+
+            self.current_size -= packet.size
+            try:
+                await self.consumer(packet)
+            except Exception:
+                # a failing consumer must not stop the drain task, or `stop_transmission(drain=True)` never returns
+                self.failed_packets += 1
+                logger.exception("Consumer failed for packet of %d bytes", packet.size)
+            else:
+                self.transmitted_packets += 1
+                self.transmitted_bytes += packet.size
+            finally:
+                self.queue.task_done()
+
+    def start_transmission(self):
+        self.transmission_task = asyncio.create_task(self.transmit())
+
+    async def stop_transmission(self, drain: bool = False):
+        """Stop forwarding packets. With `drain=True`, wait for the queued packets to be transmitted first."""
+        if self.transmission_task is None:
+            # never started (or already stopped), so nothing would drain the queue
+            return
+        if drain:
+            await self.queue.join()
+        self.transmission_task.cancel()
+        try:
+            await self.transmission_task
+        except asyncio.CancelledError:
+            pass
+        # so the transmission can be started again
+        self.transmission_task = None
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue_depth,
+            "current_size": self.current_size,
+            "transmitted_packets": self.transmitted_packets,
+            "transmitted_bytes": self.transmitted_bytes,
+            "dropped_packets": self.dropped_packets,
+            "dropped_bytes": self.dropped_bytes,
+            "failed_packets": self.failed_packets,
+        }
+
+
+async def main():
+    packet_size = [50, 100, 150, 200, 250, 300, 350, 400, 450, 500, 550, 600]
+
+    async def print_packet(packet: Packet):
+        print(f"Transmitted packet: {packet.size}")
+
+    # Same configuration as the `LeakyBucket` example, but 10x faster
+    leaky_bucket = AsyncLeakyBucket(bucket_size=1000, rate=(500, 0.2), consumer=print_packet)
+    leaky_bucket.start_transmission()
+
+    # simulating a bursty traffic by inserting N number of packets of different sizes (from 0 to 600 bytes)
+    for i in range(20):
+        packet = Packet(size=random.choice(packet_size))
+        if leaky_bucket.add_packet(packet):
+            print(f"New packet: {packet.size}. Current size: {leaky_bucket.current_size}")
+        else:
+            print(f"Capacity Full. Dropping the Packet")
+        # adding a random delay between packets arrival
+        await asyncio.sleep(random.uniform(0.01, 0.1))
+
+    await leaky_bucket.stop_transmission(drain=True)
+    print(leaky_bucket.stats())
+
+    # Thousands of buckets on a single event loop
+    n_buckets, n_packets, duration = 5000, 200_000, 2.0
+    delivered = 0
+
+    async def count_packet(packet: Packet):
+        nonlocal delivered
+        delivered += 1
+
+    buckets = [
+        AsyncLeakyBucket(bucket_size=1000, rate=(500, 0.1), consumer=count_packet)
+        for _ in range(n_buckets)
+    ]
+    for bucket in buckets:
+        bucket.start_transmission()
+
+    start = time.perf_counter()
+    for i in range(n_packets):
+        random.choice(buckets).add_packet(Packet(size=random.choice(packet_size)))
+        # spread the arrivals over `duration` seconds
+        if i % 1000 == 0:
+            await asyncio.sleep(duration * 1000 / n_packets)
+
+    await asyncio.gather(*(bucket.stop_transmission(drain=True) for bucket in buckets))
+    elapsed = time.perf_counter() - start
+
+    dropped = sum(bucket.dropped_packets for bucket in buckets)
+    print(
+        f"{n_buckets} buckets: delivered {delivered} packets, dropped {dropped} packets in {elapsed:.2f} sec"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,401 @@
+"""
+Distributed Token Bucket
+========================
+
+`TokenBucket` in `token-bucket.py` keeps its tokens in process memory, so every worker process gets its own bucket &
+N workers together let through N times the configured rate (refer `rate-limiter.md` - Distributed Rate Limiting).
+
+Here, the bucket state lives in a shared store behind a small backend interface:
+1. `InProcessBackend` - a dict guarded by a lock. Only shared between threads of the same process.
+2. `SharedMemoryBackend` - fixed size slots in a `multiprocessing.shared_memory` block guarded by a `multiprocessing.Lock`.
+   Shared between processes on the same machine.
+3. `RedisBackend` - the bucket is a Redis hash, updated atomically by a Lua script. Shared between machines. It speaks
+   the Redis protocol (RESP) directly, & `FakeRedisServer` is a local stand-in that understands just this script.
+
+Instead of the refill thread used by `TokenBucket`, the backends refill lazily - tokens are added based on the time
+elapsed since the last refill whenever a bucket is touched.
+
+A round-trip to the shared store per request is expensive. `LeasingTokenBucket` leases a batch of `lease_size` tokens
+from the backend & then admits requests locally until the lease runs out. The trade-off:
+1. Larger leases mean fewer round-trips & higher throughput.
+2. Leased tokens can sit unused in one process while another process is rejecting requests, & leftover tokens are spent
+   later in a burst on top of freshly refilled ones (overshoot). `lease_ttl` bounds how long leased tokens stay valid.
+
+Running this script benchmarks admitted rate, overshoot & throughput for different lease sizes.
+"""
+
+import hashlib
+import multiprocessing
+import socket
+import socketserver
+import struct
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from functools import partial
+from multiprocessing import shared_memory
+from typing import Dict, Hashable, Tuple
+
+
+def refill(
+    tokens: float, last_refill: float, now: float, bucket_size: int, rate: Tuple[int, int]
+) -> float:
+    """Add the tokens generated since `last_refill`, capped at `bucket_size`."""
+    elapsed = max(now - last_refill, 0.0)
+    return min(bucket_size, tokens + elapsed * rate[0] / rate[1])
+
+
+class TokenBackend(ABC):
+    """Shared token bucket state. `acquire` must refill & take tokens atomically."""
+
+    def __init__(self, bucket_size: int, refresh_rate: Tuple[int, int]) -> None:
+        self.bucket_size = bucket_size
+        self.refresh_rate = refresh_rate  # (tokens, seconds)
+
+    @abstractmethod
+    def acquire(self, key: str, requested: int) -> int:
+        """Take up to `requested` tokens from the bucket of `key` & return the number of tokens granted."""
+
+    def close(self) -> None:
+        pass
+
+
+class InProcessBackend(TokenBackend):
+    def __init__(self, bucket_size: int, refresh_rate: Tuple[int, int]) -> None:
+        super().__init__(bucket_size, refresh_rate)
+        self.buckets: Dict[Hashable, Tuple[float, float]] = {}  # key -> (tokens, last_refill)
+        self.lock = threading.Lock()
+
+    def acquire(self, key: str, requested: int) -> int:
+        with self.lock:
+            now = time.time()
+            tokens, last_refill = self.buckets.get(key, (self.bucket_size, now))
+            tokens = refill(tokens, last_refill, now, self.bucket_size, self.refresh_rate)
+            granted = min(requested, int(tokens))
+            self.buckets[key] = (tokens - granted, now)
+            return granted
+
+
+class SharedMemoryBackend(TokenBackend):
+    """
+    Every key is hashed to one of `n_slots` slots. A slot holds (tokens, last_refill, initialized) as 3 float64s.
+    Keys which hash to the same slot share a bucket, so `n_slots` should be well above the number of active keys.
+    """
+
+    SLOT = struct.Struct("ddd")
+
+    def __init__(
+        self,
+        bucket_size: int,
+        refresh_rate: Tuple[int, int],
+        lock,
+        name: str = None,
+        n_slots: int = 1024,
+    ) -> None:
+        super().__init__(bucket_size, refresh_rate)
+        self.lock = lock  # multiprocessing.Lock shared by all the processes
+        self.n_slots = n_slots
+        if name is None:
+            # the creator owns the block, the other processes attach to it by name
+            self.shm = shared_memory.SharedMemory(create=True, size=n_slots * self.SLOT.size)
+            self.shm.buf[:] = bytes(self.shm.size)
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self.name = self.shm.name
+
+    def acquire(self, key: str, requested: int) -> int:
+        offset = (zlib.crc32(key.encode()) % self.n_slots) * self.SLOT.size
+        with self.lock:
+            now = time.time()
+            tokens, last_refill, initialized = self.SLOT.unpack_from(self.shm.buf, offset)
+            if not initialized:
+                tokens, last_refill = self.bucket_size, now
+            tokens = refill(tokens, last_refill, now, self.bucket_size, self.refresh_rate)
+            granted = min(requested, int(tokens))
+            self.SLOT.pack_into(self.shm.buf, offset, tokens - granted, now, 1.0)
+            return granted
+
+    def close(self) -> None:
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+# Refill & take tokens atomically inside Redis. Uses the Redis server clock, so the clocks of the workers don't matter.
+TOKEN_BUCKET_SCRIPT = """
+local requested = tonumber(ARGV[1])
+local bucket_size = tonumber(ARGV[2])
+local tokens_per_second = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'last_refill')
+local tokens = tonumber(state[1]) or bucket_size
+local last_refill = tonumber(state[2]) or now
+tokens = math.min(bucket_size, tokens + math.max(now - last_refill, 0) * tokens_per_second)
+local granted = math.min(requested, math.floor(tokens))
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens - granted), 'last_refill', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(bucket_size / tokens_per_second) + 1)
+return granted
+"""
+TOKEN_BUCKET_SCRIPT_SHA = hashlib.sha1(TOKEN_BUCKET_SCRIPT.encode()).hexdigest()
+
+
+class RedisError(Exception):
+    pass
+
+
+class RedisConnection:
+    """Bare minimum RESP client - sends a command as an array of bulk strings & parses the reply."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 6379) -> None:
+        self.sock = socket.create_connection((host, port))
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile("rb")
+
+    def execute(self, *args):
+        command = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            arg = arg if isinstance(arg, bytes) else str(arg).encode()
+            command.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        self.sock.sendall(b"".join(command))
+        return self.read_reply()
+
+    def read_reply(self):
+        line = self.reader.readline()
+        prefix, payload = line[:1], line[1:-2]
+        if prefix == b"+":
+            return payload.decode()
+        if prefix == b"-":
+            raise RedisError(payload.decode())
+        if prefix == b":":
+            return int(payload)
+        if prefix == b"$":
+            length = int(payload)
+            if length == -1:
+                return None
+            return self.reader.read(length + 2)[:-2]
+        if prefix == b"*":
+            return [self.read_reply() for _ in range(int(payload))]
+        raise RedisError(f"Unexpected reply: {line!r}")
+
+    def close(self) -> None:
+        self.reader.close()
+        self.sock.close()
+
+
+class RedisBackend(TokenBackend):
+    def __init__(
+        self,
+        bucket_size: int,
+        refresh_rate: Tuple[int, int],
+        host: str = "127.0.0.1",
+        port: int = 6379,
+        prefix: str = "rate-limit:",
+    ) -> None:
+        super().__init__(bucket_size, refresh_rate)
+        self.conn = RedisConnection(host, port)
+        self.prefix = prefix
+        self.tokens_per_second = refresh_rate[0] / refresh_rate[1]
+
+    def acquire(self, key: str, requested: int) -> int:
+        args = (1, self.prefix + key, requested, self.bucket_size, self.tokens_per_second)
+        try:
+            return self.conn.execute("EVALSHA", TOKEN_BUCKET_SCRIPT_SHA, *args)
+        except RedisError as e:
+            # script cache is empty (first call or server restart), send the whole script once
+            if not str(e).startswith("NOSCRIPT"):
+                raise
+            return self.conn.execute("EVAL", TOKEN_BUCKET_SCRIPT, *args)
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+class FakeRedisServer(socketserver.ThreadingTCPServer):
+    """
+    Local stand-in for Redis. Understands `PING`, `SCRIPT LOAD`, `EVAL` & `EVALSHA` - the only script it can run is
+    `TOKEN_BUCKET_SCRIPT`, which is executed by an `InProcessBackend` (one per bucket configuration).
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address: Tuple[str, int] = ("127.0.0.1", 0)) -> None:
+        super().__init__(address, FakeRedisHandler)
+        self.scripts = set()
+        self.backends: Dict[Tuple[int, float], InProcessBackend] = {}
+        self.lock = threading.Lock()
+
+    def eval_token_bucket(self, key: str, requested: int, bucket_size: int, tokens_per_second: float) -> int:
+        with self.lock:
+            backend = self.backends.get((bucket_size, tokens_per_second))
+            if backend is None:
+                backend = InProcessBackend(bucket_size, (tokens_per_second, 1))
+                self.backends[(bucket_size, tokens_per_second)] = backend
+        return backend.acquire(key, requested)
+
+    def start(self) -> None:
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+
+class FakeRedisHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            args = []
+            for _ in range(int(line[1:-2])):
+                length = int(self.rfile.readline()[1:-2])
+                args.append(self.rfile.read(length + 2)[:-2])
+            self.wfile.write(self.dispatch(args))
+
+    def dispatch(self, args) -> bytes:
+        command = args[0].upper()
+        if command == b"PING":
+            return b"+PONG\r\n"
+        if command == b"SCRIPT" and args[1].upper() == b"LOAD":
+            sha = hashlib.sha1(args[2]).hexdigest()
+            self.server.scripts.add(sha)
+            return b"$%d\r\n%s\r\n" % (len(sha), sha.encode())
+        if command in (b"EVAL", b"EVALSHA"):
+            if command == b"EVAL":
+                sha = hashlib.sha1(args[1]).hexdigest()
+                self.server.scripts.add(sha)
+            else:
+                sha = args[1].decode()
+                if sha not in self.server.scripts:
+                    return b"-NOSCRIPT No matching script. Please use EVAL.\r\n"
+            if sha != TOKEN_BUCKET_SCRIPT_SHA:
+                return b"-ERR fake server can only run the token bucket script\r\n"
+            key = args[3].decode()
+            requested, bucket_size, tokens_per_second = int(args[4]), int(args[5]), float(args[6])
+            granted = self.server.eval_token_bucket(key, requested, bucket_size, tokens_per_second)
+            return b":%d\r\n" % granted
+        return b"-ERR unknown command '%s'\r\n" % args[0]
+
+
+class LeasingTokenBucket:
+    def __init__(self, backend: TokenBackend, lease_size: int = 10, lease_ttl: float = 1.0) -> None:
+        self.backend = backend
+        self.lease_size = lease_size
+        self.lease_ttl = lease_ttl  # leased tokens not spent within this time are given up
+        self.leases: Dict[str, Tuple[int, float]] = {}  # key -> (tokens, expires_at)
+        # after an empty lease, don't ask the backend again until a lease worth of tokens could have been refilled
+        rate = backend.refresh_rate
+        self.backoff = lease_size * rate[1] / rate[0]
+        self.retry_at: Dict[str, float] = {}
+        self.round_trips = 0
+
+    def consume_token(self, key: str) -> bool:
+        now = time.monotonic()
+        tokens, expires_at = self.leases.get(key, (0, 0.0))
+        if tokens > 0 and now < expires_at:
+            self.leases[key] = (tokens - 1, expires_at)
+            return True
+
+        if now < self.retry_at.get(key, 0.0):
+            return False
+
+        self.round_trips += 1
+        granted = self.backend.acquire(key, self.lease_size)
+        if granted == 0:
+            self.retry_at[key] = now + self.backoff
+            return False
+        self.leases[key] = (granted - 1, now + self.lease_ttl)
+        return True
+
+
+def benchmark_worker(backend_factory, lease_size, key, start, duration, window, results):
+    backend = backend_factory()
+    limiter = LeasingTokenBucket(backend, lease_size=lease_size)
+
+    # number of admitted requests in every `window` seconds
+    admitted = [0] * (int(duration / window) + 1)
+    decisions = 0
+    while time.time() < start:
+        pass
+    end = start + duration
+    now = time.time()
+    while now < end:
+        if limiter.consume_token(key):
+            admitted[int((now - start) / window)] += 1
+        decisions += 1
+        now = time.time()
+
+    backend.close()
+    results.put((admitted, decisions, limiter.round_trips))
+
+
+def run_benchmark(backend_factory, n_workers, lease_size, bucket_size, refresh_rate, duration=2.0, window=0.1):
+    results = multiprocessing.Queue()
+    start = time.time() + 0.5  # let all the workers start before the clock starts ticking
+    workers = [
+        multiprocessing.Process(
+            target=benchmark_worker,
+            args=(backend_factory, lease_size, "client", start, duration, window, results),
+        )
+        for _ in range(n_workers)
+    ]
+    for worker in workers:
+        worker.start()
+    outcomes = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+
+    admitted = [sum(counts) for counts in zip(*(outcome[0] for outcome in outcomes))]
+    decisions = sum(outcome[1] for outcome in outcomes)
+    round_trips = sum(outcome[2] for outcome in outcomes)
+
+    tokens_per_second = refresh_rate[0] / refresh_rate[1]
+    # most requests the bucket could have admitted in the whole run & in any 1 second
+    allowed = bucket_size + tokens_per_second * duration
+    per_second = int(1 / window)
+    peak = max(sum(admitted[i : i + per_second]) for i in range(max(len(admitted) - per_second + 1, 1)))
+    return {
+        "admitted": sum(admitted),
+        "allowed": int(allowed),
+        "peak_1s": peak,
+        "peak_1s_allowed": int(bucket_size + tokens_per_second),
+        "decisions_per_sec": decisions / duration,
+        "round_trips_per_decision": round_trips / max(decisions, 1),
+    }
+
+
+if __name__ == "__main__":
+    N_WORKERS = 8  # bump up to the number of worker processes in production, eg - 40
+    BUCKET_SIZE = 1000
+    REFRESH_RATE = (5000, 1)  # 5000 tokens per second
+    LEASE_SIZES = [1, 10, 100, 500]
+
+    server = FakeRedisServer()
+    server.start()
+    host, port = server.server_address
+    lock = multiprocessing.Lock()
+
+    print(
+        f"{'backend':<14}{'lease':>6}{'admitted':>10}{'allowed':>9}{'overshoot':>11}"
+        f"{'peak 1s':>9}{'decisions/s':>13}{'round trips':>13}"
+    )
+    for lease_size in LEASE_SIZES:
+        owner = SharedMemoryBackend(BUCKET_SIZE, REFRESH_RATE, lock)
+        backends = {
+            "shared_memory": partial(SharedMemoryBackend, BUCKET_SIZE, REFRESH_RATE, lock, name=owner.name),
+            # a different key prefix per run, so the runs don't share a bucket
+            "redis": partial(RedisBackend, BUCKET_SIZE, REFRESH_RATE, host, port, prefix=f"lease-{lease_size}:"),
+        }
+        for name, factory in backends.items():
+            stats = run_benchmark(factory, N_WORKERS, lease_size, BUCKET_SIZE, REFRESH_RATE)
+            overshoot = stats["admitted"] / stats["allowed"] - 1
+            print(
+                f"{name:<14}{lease_size:>6}{stats['admitted']:>10}{stats['allowed']:>9}{overshoot:>+11.1%}"
+                f"{stats['peak_1s']:>9}{stats['decisions_per_sec']:>13,.0f}"
+                f"{stats['round_trips_per_decision']:>13.4f}"
+            )
+        owner.close()
+
+    server.shutdown()
@@ -0,0 +1,209 @@
+"""
+Generic Cell Rate Algorithm (GCRA)
+==================================
+
+GCRA is a leaky bucket that does not need a background thread to "leak". Instead of storing the current fill level of
+the bucket & draining it periodically, it stores a single float per key - the Theoretical Arrival Time (TAT). The TAT is
+the time at which the bucket would be completely empty if no more packets arrived.
+
+Given the same `bucket_size` & `rate` as `LeakyBucket` in `leaky-bucket.py`:
+1. emission interval `T = rate[1] / rate[0]` - seconds it takes to leak 1 byte
+2. tolerance `tau = bucket_size * T` - how far ahead of `now` the TAT is allowed to run (i.e. a full bucket)
+
+When a packet of `size` bytes arrives at time `now`:
+1. `tat = max(tat, now)` - an idle bucket has already leaked empty
+2. `new_tat = tat + size * T` - adding the packet to the bucket pushes the TAT forward
+3. If `new_tat - now > tau`, the packet would overflow the bucket & it is dropped. Otherwise, store `new_tat`.
+
+The current fill level can always be recovered as `(tat - now) / T`, so this is exactly the leaky bucket admission rule,
+with the leak applied continuously instead of in `rate[0]` sized steps every `rate[1]` seconds.
+
+Since the state is just one float64 per key, the TATs of all clients can be packed into a NumPy array indexed by client
+id & a whole batch of requests can be admitted with a handful of vectorized operations.
+"""
+
+import random
+import threading
+import time
+from typing import Dict, Hashable, Optional, Tuple
+
+import numpy as np
+
+
+class GCRA:
+    def __init__(self, bucket_size: int, rate: Tuple[int, int]) -> None:
+        self.bucket_size = bucket_size
+        self.rate = rate  # leaky rate. eg - (500, 2) implies 500 bytes every 2 seconds
+        self.emission_interval = rate[1] / rate[0]  # seconds to leak 1 byte
+        self.tolerance = bucket_size * self.emission_interval
+        self.tat: Dict[Hashable, float] = {}  # theoretical arrival time per key
+        self.lock = threading.Lock()
+
+    def allow(self, key: Hashable, size: int = 1, now: Optional[float] = None) -> bool:
+        if now is None:
+            now = time.monotonic()
+
+        # the critical section is a single read & write of one float
+        with self.lock:
+            tat = max(self.tat.get(key, now), now)
+            new_tat = tat + size * self.emission_interval
+            if new_tat - now > self.tolerance:
+                return False
+            self.tat[key] = new_tat
+            return True
+
+    def current_size(self, key: Hashable, now: Optional[float] = None) -> float:
+        """Fill level of the equivalent leaky bucket (in bytes)."""
+        if now is None:
+            now = time.monotonic()
+        tat = self.tat.get(key, now)
+        return max(tat - now, 0.0) / self.emission_interval
+
+
+class VectorizedGCRA:
+    # requests of a client beyond this many in a batch are admitted by `_admit_run`
+    SHORT_RUN = 32
+
+    def __init__(self, n_clients: int, bucket_size: int, rate: Tuple[int, int]) -> None:
+        self.bucket_size = bucket_size
+        self.rate = rate
+        self.emission_interval = rate[1] / rate[0]
+        self.tolerance = bucket_size * self.emission_interval
+        # one theoretical arrival time per client, indexed by client id
+        self.tat = np.zeros(n_clients, dtype=np.float64)
+
+    def allow_batch(
+        self, client_ids: np.ndarray, sizes: np.ndarray, now: float
+    ) -> np.ndarray:
+        """
+        Admit a batch of requests arriving at `now`.
+
+        Requests are admitted in the order they appear in the batch, exactly as if `GCRA.allow` was called for each of
+        them. The requests are grouped into a run per client (a stable sort by client id) -
+        1. The first `SHORT_RUN` requests of every run are processed in rounds - the k-th round processes the k-th
+           request of every run, so a round touches each client at most once & can be vectorized.
+        2. The rest of the longer runs (hot clients) are processed one run at a time by `_admit_run`, which admits whole
+           stretches of requests at once.
+
+        :param client_ids: Integer client ids (indices into `self.tat`)
+        :param sizes: Size of each request (in bytes)
+        :param now: Arrival time of the batch
+        :return: Boolean array, True where the request was admitted
+        """
+        client_ids = np.asarray(client_ids, dtype=np.int64)
+        sizes = np.broadcast_to(np.asarray(sizes, dtype=np.float64), client_ids.shape)
+        allowed = np.zeros(client_ids.shape, dtype=bool)
+        if client_ids.size == 0:
+            return allowed
+
+        order = np.argsort(client_ids, kind="stable")
+        sorted_ids = client_ids[order]
+        costs = sizes[order] * self.emission_interval
+        run_starts = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]])
+        run_lengths = np.diff(np.r_[run_starts, sorted_ids.size])
+        run_ids = sorted_ids[run_starts]
+
+        # tat of every run's client, an idle bucket has already leaked empty
+        initial_tat = np.maximum(self.tat[run_ids], now)
+        tat = initial_tat.copy()
+        sorted_allowed = np.zeros(sorted_ids.size, dtype=bool)
+
+        for rank in range(min(int(run_lengths.max()), self.SHORT_RUN)):
+            runs = np.flatnonzero(run_lengths > rank)
+            positions = run_starts[runs] + rank
+            new_tat = tat[runs] + costs[positions]
+            ok = (new_tat - now) <= self.tolerance
+            tat[runs[ok]] = new_tat[ok]
+            sorted_allowed[positions] = ok
+
+        for run in np.flatnonzero(run_lengths > self.SHORT_RUN):
+            start, end = run_starts[run] + self.SHORT_RUN, run_starts[run] + run_lengths[run]
+            tat[run] = self._admit_run(tat[run], costs[start:end], sorted_allowed[start:end], now)
+
+        # like `GCRA.allow`, only the clients with an admitted request get a new tat
+        changed = tat != initial_tat
+        self.tat[run_ids[changed]] = tat[changed]
+        allowed[order] = sorted_allowed
+        return allowed
+
+    def _admit_run(self, tat: float, costs: np.ndarray, allowed: np.ndarray, now: float) -> float:
+        """
+        Admit the requests of a single client in order, writing the decisions into `allowed`. Returns the final tat.
+
+        Instead of one request at a time, every step -
+        1. skips the requests which don't fit into the bucket on their own
+        2. admits the requests from there up to the first one which overflows the bucket. `np.add.accumulate` adds the
+           costs one after the other, so the tats (& the decisions) are exactly those of `GCRA.allow`.
+        The number of steps is bounded by the requests which fit into the bucket, not by the length of the run.
+        """
+        position = 0
+        while position < len(costs):
+            fits = np.flatnonzero((tat + costs[position:]) - now <= self.tolerance)
+            if fits.size == 0:
+                break
+            position += fits[0]
+
+            tats = np.add.accumulate(np.r_[tat, costs[position:]])[1:]
+            overflows = np.flatnonzero(tats - now > self.tolerance)
+            admitted = overflows[0] if overflows.size else tats.size
+            allowed[position : position + admitted] = True
+            tat = tats[admitted - 1]
+            # the request at `position + admitted` overflowed
+            position += admitted + 1
+        return tat
+
+
+if __name__ == "__main__":
+    # Same configuration as the `LeakyBucket` example
+    gcra = GCRA(bucket_size=1000, rate=(500, 2))
+
+    # simulating a bursty traffic by inserting N number of packets of different sizes (from 0 to 600 bytes)
+    packet_size = [50, 100, 150, 200, 250, 300, 350, 400, 450, 500, 550, 600]
+    now = 0.0
+    for i in range(20):
+        size = random.choice(packet_size)
+        if gcra.allow("client", size, now=now):
+            print(f"New packet: {size}. Current size: {gcra.current_size('client', now):.0f}")
+        else:
+            print(f"Capacity Full. Dropping the Packet")
+        # adding a random delay between packets arrival
+        now += random.uniform(0.1, 1.0)
+
+    # Vectorized admission for 100K clients - check it agrees with the scalar version
+    n_clients, batch_size = 100_000, 1_000_000
+    vectorized = VectorizedGCRA(n_clients, bucket_size=1000, rate=(500, 2))
+    scalar = GCRA(bucket_size=1000, rate=(500, 2))
+
+    client_ids = np.random.randint(0, 1000, size=2000)
+    sizes = np.random.choice(packet_size, size=2000)
+    expected = [scalar.allow(int(c), int(s), now=1.0) for c, s in zip(client_ids, sizes)]
+    assert (vectorized.allow_batch(client_ids, sizes, now=1.0) == expected).all()
+
+    # a hot client sending 50K requests in a single batch, with mixed sizes
+    hot_ids = np.zeros(50_000, dtype=np.int64)
+    hot_sizes = np.random.choice(packet_size, size=hot_ids.size)
+    hot_vectorized = VectorizedGCRA(1, bucket_size=1000, rate=(500, 2))
+    hot_scalar = GCRA(bucket_size=1000, rate=(500, 2))
+    for now in [1.0, 1.5, 4.0]:
+        start = time.perf_counter()
+        expected = [hot_scalar.allow(0, int(s), now=now) for s in hot_sizes]
+        scalar_elapsed = time.perf_counter() - start
+        start = time.perf_counter()
+        allowed = hot_vectorized.allow_batch(hot_ids, hot_sizes, now=now)
+        elapsed = time.perf_counter() - start
+        assert (allowed == expected).all()
+        assert hot_vectorized.tat[0] == hot_scalar.tat[0]
+    print(
+        f"Hot client: admitted {allowed.sum()}/{hot_ids.size} requests in {elapsed * 1000:.1f} ms "
+        f"(scalar: {scalar_elapsed * 1000:.1f} ms)"
+    )
+
+    client_ids = np.random.randint(0, n_clients, size=batch_size)
+    sizes = np.random.choice(packet_size, size=batch_size)
+    start = time.perf_counter()
+    allowed = vectorized.allow_batch(client_ids, sizes, now=2.0)
+    elapsed = time.perf_counter() - start
+    print(
+        f"Admitted {allowed.sum()}/{batch_size} requests for {n_clients} clients in {elapsed * 1000:.1f} ms "
+        f"({batch_size / elapsed / 1e6:.1f}M decisions/sec)"
+    )
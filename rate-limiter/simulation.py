@@ -0,0 +1,203 @@
+"""
+Rate Limiter Load Simulation
+============================
+
+The examples in `token-bucket.py` & `leaky-bucket.py` sleep for random durations & print, which doesn't tell much about
+how a limiter behaves at tens of thousands of requests per second.
+
+This harness replays an arrival pattern against a limiter on a virtual clock - the arrival timestamps are generated up
+front & passed to the limiter as `now`, so a run is deterministic (for a given seed) & doesn't sleep at all.
+
+A limiter is any object with an `allow(key, now=...) -> bool` method. The thread based `TokenBucket` & `LeakyBucket`
+refill / leak on the wall clock, so `TokenBucketLimiter` (lazy refill) & `GCRA` (leaky bucket) are used in their place.
+
+Arrival patterns:
+1. `poisson_arrivals` - exponentially distributed inter-arrival times, clients picked with a Zipf-like skew
+2. `bursty_arrivals` - Poisson traffic which periodically switches to a much higher burst rate
+3. `trace_arrivals` - replay a recorded `timestamp,client` CSV trace
+
+Reported metrics:
+1. admitted rate - admitted requests per second of virtual time
+2. p50 / p99 admission latency - wall clock time taken by the limiter to make a decision
+3. CPU time per decision - process CPU time of the whole replay divided by the number of requests
+4. fairness - Jain's fairness index over the fraction of requests admitted per client (1.0 means all clients were
+   treated the same, 1/n means a single client got everything)
+"""
+
+import bisect
+import csv
+import random
+import time
+from dataclasses import dataclass
+from typing import Dict, Hashable, Iterable, Iterator, List, Tuple
+
+from distributed_token_bucket import refill
+from gcra import GCRA
+
+Arrival = Tuple[float, str]  # (timestamp in seconds, client)
+
+
+class TokenBucketLimiter:
+    def __init__(self, bucket_size: int, refresh_rate: Tuple[int, int]) -> None:
+        self.bucket_size = bucket_size
+        self.refresh_rate = refresh_rate  # (tokens, seconds)
+        self.buckets: Dict[Hashable, Tuple[float, float]] = {}  # key -> (tokens, last_refill)
+
+    def allow(self, key: Hashable, now: float) -> bool:
+        tokens, last_refill = self.buckets.get(key, (self.bucket_size, now))
+        tokens = refill(tokens, last_refill, now, self.bucket_size, self.refresh_rate)
+        if tokens < 1:
+            self.buckets[key] = (tokens, now)
+            return False
+        self.buckets[key] = (tokens - 1, now)
+        return True
+
+
+def client_picker(rng: random.Random, n_clients: int, skew: float):
+    """Pick client `i` with probability proportional to 1 / (i + 1) ** skew. `skew=0` is uniform."""
+    clients = [f"client-{i}" for i in range(n_clients)]
+    weights = [1 / (i + 1) ** skew for i in range(n_clients)]
+    cumulative, total = [], 0.0
+    for weight in weights:
+        total += weight
+        cumulative.append(total)
+    return lambda: clients[bisect.bisect(cumulative, rng.random() * total)]
+
+
+def poisson_arrivals(
+    rate: float, duration: float, n_clients: int = 100, skew: float = 0.0, seed: int = 0
+) -> Iterator[Arrival]:
+    rng = random.Random(seed)
+    pick = client_picker(rng, n_clients, skew)
+    now = rng.expovariate(rate)
+    while now < duration:
+        yield now, pick()
+        now += rng.expovariate(rate)
+
+
+def bursty_arrivals(
+    base_rate: float,
+    burst_rate: float,
+    burst_every: float,
+    burst_length: float,
+    duration: float,
+    n_clients: int = 100,
+    skew: float = 0.0,
+    seed: int = 0,
+) -> Iterator[Arrival]:
+    """Poisson arrivals at `base_rate`, except for the first `burst_length` seconds of every `burst_every` seconds."""
+    rng = random.Random(seed)
+    pick = client_picker(rng, n_clients, skew)
+    now = 0.0
+    while True:
+        in_burst = (now % burst_every) < burst_length
+        now += rng.expovariate(burst_rate if in_burst else base_rate)
+        if now >= duration:
+            return
+        yield now, pick()
+
+
+def trace_arrivals(path: str) -> Iterator[Arrival]:
+    """Replay a CSV trace with `timestamp,client` rows. Timestamps are shifted to start at 0."""
+    with open(path, newline="") as f:
+        start = None
+        for timestamp, client in csv.reader(f):
+            timestamp = float(timestamp)
+            if start is None:
+                start = timestamp
+            yield timestamp - start, client
+
+
+def percentile(values: List[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * p / 100), len(values) - 1)]
+
+
+def jain_fairness(values: Iterable[float]) -> float:
+    values = list(values)
+    squares = sum(value * value for value in values)
+    return sum(values) ** 2 / (len(values) * squares) if squares else 1.0
+
+
+@dataclass
+class SimulationResult:
+    requests: int
+    admitted: int
+    duration: float
+    admitted_rate: float
+    p50_latency_us: float
+    p99_latency_us: float
+    cpu_per_decision_us: float
+    fairness: float
+
+
+def simulate(limiter, arrivals: Iterable[Arrival], per_client: bool = True) -> SimulationResult:
+    """
+    Replay `arrivals` against `limiter`.
+
+    :param limiter: Object with an `allow(key, now=...) -> bool` method
+    :param arrivals: (timestamp, client) pairs in increasing order of timestamp
+    :param per_client: If True, every client has its own limit. Otherwise, all clients share a single global limit.
+    """
+    # materialize the arrivals first, so generating them isn't counted as limiter CPU time
+    arrivals = list(arrivals)
+    offered: Dict[str, int] = {}
+    admitted: Dict[str, int] = {}
+    latencies = [0.0] * len(arrivals)
+
+    clock = time.perf_counter
+    cpu_start = time.process_time()
+    for i, (now, client) in enumerate(arrivals):
+        key = client if per_client else "global"
+        start = clock()
+        allowed = limiter.allow(key, now=now)
+        latencies[i] = clock() - start
+
+        offered[client] = offered.get(client, 0) + 1
+        if allowed:
+            admitted[client] = admitted.get(client, 0) + 1
+    cpu_time = time.process_time() - cpu_start
+
+    n = max(len(arrivals), 1)
+    duration = arrivals[-1][0] if arrivals else 0.0
+    total_admitted = sum(admitted.values())
+    return SimulationResult(
+        requests=len(arrivals),
+        admitted=total_admitted,
+        duration=duration,
+        admitted_rate=total_admitted / duration if duration else 0.0,
+        p50_latency_us=percentile(latencies, 50) * 1e6 if arrivals else 0.0,
+        p99_latency_us=percentile(latencies, 99) * 1e6 if arrivals else 0.0,
+        cpu_per_decision_us=cpu_time / n * 1e6,
+        fairness=jain_fairness(admitted.get(client, 0) / count for client, count in offered.items()),
+    )
+
+
+if __name__ == "__main__":
+    DURATION = 10  # seconds of virtual time
+    N_CLIENTS = 1000
+
+    patterns = {
+        "poisson 50K/s": lambda: poisson_arrivals(50_000, DURATION, N_CLIENTS, skew=1.0),
+        "bursty 20K/s -> 200K/s": lambda: bursty_arrivals(
+            20_000, 200_000, burst_every=2, burst_length=0.2, duration=DURATION, n_clients=N_CLIENTS, skew=1.0
+        ),
+    }
+    # every client may send 20 requests per second, with bursts of up to 40 requests
+    limiters = {
+        "token bucket": lambda: TokenBucketLimiter(bucket_size=40, refresh_rate=(20, 1)),
+        "gcra": lambda: GCRA(bucket_size=40, rate=(20, 1)),
+    }
+
+    print(
+        f"{'pattern':<24}{'limiter':<14}{'requests':>10}{'admitted/s':>12}{'p50 us':>8}{'p99 us':>8}"
+        f"{'cpu us':>8}{'fairness':>10}"
+    )
+    for pattern_name, pattern in patterns.items():
+        for limiter_name, limiter in limiters.items():
+            result = simulate(limiter(), pattern())
+            print(
+                f"{pattern_name:<24}{limiter_name:<14}{result.requests:>10}{result.admitted_rate:>12,.0f}"
+                f"{result.p50_latency_us:>8.2f}{result.p99_latency_us:>8.2f}{result.cpu_per_decision_us:>8.2f}"
+                f"{result.fairness:>10.3f}"
+            )
@@ -0,0 +1,173 @@
+"""
+Asyncio Server-Sent Events server.
+
+`server.py` (Flask) ties up a WSGI worker thread for as long as a client keeps the stream open. This server serves the
+same `/stock-updates` contract using plain `asyncio` streams, so an open stream is just a coroutine waiting on its
+queue & a single process can hold tens of thousands of streams.
+
+1. One publisher task produces & encodes every update once, the hub fans it out to an `AsyncSubscriber` per client.
+2. One heartbeat task sends an SSE comment (`: heartbeat`) to all the clients every `HEARTBEAT_INTERVAL` seconds. It
+   keeps proxies from closing idle connections & lets the server notice clients which went away.
+3. Frames queued while a client was busy are written together in a single write.
+4. `?stocks=AAPL,MSFT` subscribes to a subset of symbols & `?coalesce=1` sends only the latest price per symbol.
+5. `?batch=100` batches the updates of every 100 ms into a single `batch` event & the stream is gzipped if the client
+   sends `Accept-Encoding: gzip`.
+
+Run `python async_server.py` & point `client.html` at it, or use `load_test.py` to open thousands of connections.
+"""
+
+import asyncio
+from urllib.parse import parse_qs
+
+from hub import (
+    HEARTBEAT,
+    HEARTBEAT_INTERVAL,
+    AsyncCoalescingSubscriber,
+    AsyncSubscriber,
+    GzipStream,
+    Hub,
+    accepts_gzip,
+    encode_batch,
+    generate_stock_price,
+    parse_batch_interval,
+    parse_last_event_id,
+    parse_topics,
+)
+
+HOST = "127.0.0.1"
+PORT = 5000
+PUBLISH_INTERVAL = 1.0
+
+RESPONSE_HEADERS = (
+    b"HTTP/1.1 200 OK\r\n"
+    b"Content-Type: text/event-stream\r\n"
+    b"Cache-Control: no-cache\r\n"
+    b"Connection: keep-alive\r\n"
+    b"Access-Control-Allow-Origin: *\r\n"
+)
+BAD_REQUEST = (
+    b"HTTP/1.1 400 Bad Request\r\n"
+    b"Content-Length: 0\r\n"
+    b"Connection: close\r\n"
+    b"\r\n"
+)
+NOT_FOUND = (
+    b"HTTP/1.1 404 Not Found\r\n"
+    b"Content-Length: 0\r\n"
+    b"Connection: close\r\n"
+    b"\r\n"
+)
+
+
+async def read_request(reader: asyncio.StreamReader):
+    """Read the request line & headers. Returns (method, path, headers)."""
+    request_line = await reader.readline()
+    method, target, _ = request_line.decode("latin-1").split(" ", 2)
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return method, target, headers
+
+
+def make_handler(hub: Hub):
+    async def handle_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            method, target, headers = await read_request(reader)
+        except (ValueError, ConnectionError):
+            writer.close()
+            return
+
+        path, _, query = target.partition("?")
+        params = parse_qs(query)
+        if method != "GET" or path != "/stock-updates":
+            writer.write(NOT_FOUND)
+            writer.close()
+            return
+
+        # ?stocks=AAPL,MSFT subscribes to just those symbols, ?coalesce=1 sends only the latest price per symbol
+        try:
+            topics = parse_topics(params.get("stocks", [""])[0])
+        except ValueError:
+            writer.write(BAD_REQUEST)
+            writer.close()
+            return
+
+        # keep the kernel & transport buffers per connection small
+        writer.transport.set_write_buffer_limits(high=64 * 1024)
+
+        gzip = GzipStream() if accepts_gzip(headers.get("accept-encoding")) else None
+        if gzip is not None:
+            writer.write(RESPONSE_HEADERS + b"Content-Encoding: gzip\r\nVary: Accept-Encoding\r\n\r\n")
+        else:
+            writer.write(RESPONSE_HEADERS + b"\r\n")
+
+        coalesce = params.get("coalesce", ["0"])[0] == "1"
+        # ?batch=100 sends the updates of every 100 ms as a single event
+        batch_interval = parse_batch_interval(params.get("batch", [""])[0])
+        last_event_id = parse_last_event_id(headers.get("last-event-id"))
+        subscriber = AsyncCoalescingSubscriber() if coalesce else AsyncSubscriber(max_queue_size=100)
+        hub.subscribe(subscriber, last_event_id, topics)
+        try:
+            while True:
+                if batch_interval is not None:
+                    chunk = encode_batch(await subscriber.get_batch(batch_interval))
+                else:
+                    chunk = await subscriber.get()
+                writer.write(gzip.compress(chunk) if gzip is not None else chunk)
+                # waits only if the client is slow. Meanwhile, its queue fills up & starts dropping old events.
+                await writer.drain()
+        except ConnectionError:
+            # client disconnected
+            pass
+        finally:
+            hub.unsubscribe(subscriber)
+            writer.close()
+
+    return handle_client
+
+
+async def publish_stock_prices(hub: Hub, interval: float):
+    loop = asyncio.get_running_loop()
+    next_publish = loop.time()
+    while True:
+        data = generate_stock_price()
+        hub.publish(data, topic=data["stock"])
+        # sleep until the next scheduled update, so short intervals (eg - 1 ms) keep their average rate
+        next_publish += interval
+        await asyncio.sleep(max(next_publish - loop.time(), 0))
+
+
+async def send_heartbeats(hub: Hub, interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        hub.broadcast(HEARTBEAT)
+
+
+async def serve(
+    host: str = HOST,
+    port: int = PORT,
+    publish_interval: float = PUBLISH_INTERVAL,
+    heartbeat_interval: float = HEARTBEAT_INTERVAL,
+):
+    hub = Hub()
+    server = await asyncio.start_server(make_handler(hub), host, port, backlog=4096, reuse_address=True)
+
+    tasks = [
+        asyncio.create_task(publish_stock_prices(hub, publish_interval)),
+        asyncio.create_task(send_heartbeats(hub, heartbeat_interval)),
+    ]
+    print(f"Serving Server-Sent Events on http://{host}:{port}/stock-updates")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+if __name__ == "__main__":
+    asyncio.run(serve())
@@ -0,0 +1,126 @@
+"""
+Measures the effect of batching & gzip on `async_server.py` at 1K updates/sec.
+
+For every mode, starts the server in a separate process, opens `--connections` streams & reports per client:
+1. bytes/sec on the wire
+2. chunks/sec - number of reads on the client, roughly the number of writes (`send` syscalls) by the server
+3. server CPU time (ms) per second
+4. dropped - % of the updates published while the stream was open which never reached the client. Every update has
+   the next event id, so the updates a client should have received are the ids between the first & the last one it saw.
+
+Linux only (reads the server CPU time from `/proc/<pid>/stat`).
+
+    python batching_benchmark.py --connections 200 --duration 5
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import re
+import time
+import zlib
+
+from async_server import serve
+
+HOST = "127.0.0.1"
+PORT = 5056
+MODES = {
+    "plain": ("", False),
+    "batch 100ms": ("?batch=100", False),
+    "gzip": ("", True),
+    "batch 100ms + gzip": ("?batch=100", True),
+    "batch 300ms": ("?batch=300", False),
+}
+EVENT_ID = re.compile(rb"^id: (\d+)$", re.MULTILINE)
+
+
+def run_server(publish_interval: float):
+    asyncio.run(serve(HOST, PORT, publish_interval=publish_interval))
+
+
+def cpu_seconds(pid: int) -> float:
+    with open(f"/proc/{pid}/stat") as f:
+        # the process name may contain spaces, so split after the closing parenthesis
+        fields = f.read().rsplit(")", 1)[1].split()
+    # utime & stime (14th & 15th fields) are in clock ticks
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+async def stream(query: str, gzip: bool, stats: dict):
+    reader, writer = await asyncio.open_connection(HOST, PORT)
+    accept_encoding = "Accept-Encoding: gzip\r\n" if gzip else ""
+    writer.write(f"GET /stock-updates{query} HTTP/1.1\r\nHost: {HOST}\r\n{accept_encoding}\r\n".encode())
+    await reader.readuntil(b"\r\n\r\n")
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if gzip else None
+    # the incomplete last event, & the first & last update ids received
+    pending, first_id, last_id, updates = b"", None, None, 0
+    try:
+        while True:
+            chunk = await reader.read(65536)
+            if not chunk:
+                return
+            stats["bytes"] += len(chunk)
+            stats["reads"] += 1
+
+            data = decompressor.decompress(chunk) if gzip else chunk
+            events, _, pending = (pending + data).rpartition(b"\n\n")
+            # every update has a "stock", a `batch` event has the id of its last update
+            updates += events.count(b'"stock"')
+            ids = EVENT_ID.findall(events)
+            if ids:
+                if first_id is None:
+                    # the id is the first line of its event
+                    first_event = events[events.find(b"id: ") :].split(b"\n\n", 1)[0]
+                    first_id = int(ids[0]) - first_event.count(b'"stock"') + 1
+                last_id = int(ids[-1])
+    finally:
+        if first_id is not None:
+            stats["expected"] += last_id - first_id + 1
+            stats["updates"] += updates
+        writer.close()
+
+
+async def measure(connections: int, query: str, gzip: bool, server_pid: int, duration: float):
+    stats = {"bytes": 0, "reads": 0, "expected": 0, "updates": 0}
+    tasks = [asyncio.create_task(stream(query, gzip, stats)) for _ in range(connections)]
+    # warm up, so all the streams are open
+    await asyncio.sleep(1)
+
+    stats["bytes"], stats["reads"] = 0, 0
+    cpu_start = cpu_seconds(server_pid)
+    await asyncio.sleep(duration)
+    cpu_time = cpu_seconds(server_pid) - cpu_start
+    received, reads = stats["bytes"], stats["reads"]
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    per_client = connections * duration
+    dropped = 1 - stats["updates"] / max(stats["expected"], 1)
+    return received / per_client, reads / per_client, cpu_time * 1000 / per_client, dropped
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--connections", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument("--updates-per-second", type=int, default=1000)
+    args = parser.parse_args()
+
+    print(f"{args.updates_per_second} updates/sec, {args.connections} clients")
+    print(f"{'mode':<22}{'bytes/sec':>12}{'chunks/sec':>12}{'cpu ms/sec':>12}{'dropped':>10}")
+    for name, (query, gzip) in MODES.items():
+        server = multiprocessing.Process(target=run_server, args=(1 / args.updates_per_second,), daemon=True)
+        server.start()
+        time.sleep(1)
+        bytes_per_second, reads_per_second, cpu_ms, dropped = asyncio.run(
+            measure(args.connections, query, gzip, server.pid, args.duration)
+        )
+        server.terminate()
+        server.join()
+        print(f"{name:<22}{bytes_per_second:>12,.0f}{reads_per_second:>12,.1f}{cpu_ms:>12.3f}{dropped:>10.2%}")
+
+
+if __name__ == "__main__":
+    main()
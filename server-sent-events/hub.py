@@ -0,0 +1,419 @@
+"""
+Broadcast hub for Server-Sent Events.
+
+Instead of every connection running its own `generate_stock_prices()` generator (its own `json.dumps` & `time.sleep`),
+a single publisher produces each event once, encodes it once as an SSE frame (`data: ...\\n\\n` bytes) & the hub fans
+the same bytes out to a bounded queue per subscriber.
+
+A subscriber that can't keep up doesn't slow down the publisher or the other subscribers - once its queue is full, the
+oldest queued event is dropped to make room for the newest one (for stock prices, the latest price is what matters).
+
+Every event gets a monotonically increasing `id:`. The hub keeps the last `history_size` encoded events in a ring
+buffer, so a client which reconnects with a `Last-Event-ID` header gets the events it missed replayed, instead of
+having to refetch the whole state. If the missed events are no longer in the buffer, the client is sent a `reset`
+event instead.
+
+Every event is published on a topic (the stock symbol). A subscriber can subscribe to a set of topics, & the hub keeps
+an index from topic to subscribers, so publishing costs time proportional to the number of interested subscribers.
+Coalescing subscribers keep only the latest undelivered frame per topic - a slow client receives the latest price of
+every symbol whenever it catches up, instead of a backlog of stale prices.
+
+At high update rates, a connection can batch the frames arriving within a flush interval into a single `batch` event
+(`get_batch` & `encode_batch`) & gzip the stream (`GzipStream`) when the client accepts it. The frames of a batch are
+collected in a local buffer as they arrive, so a batch can be larger than the subscriber's queue.
+"""
+
+import asyncio
+import json
+import queue
+import random
+import threading
+import time
+import zlib
+from collections import deque
+from itertools import islice
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+STOCKS = ["AAPL", "MSFT", "GOOG", "AMZN"]
+# An SSE comment sent to idle streams, so proxies don't close them & the server notices clients which went away
+HEARTBEAT_INTERVAL = 15.0
+HEARTBEAT = b": heartbeat\n\n"
+
+
+def generate_stock_price() -> dict:
+    """Simulate a single stock price update."""
+    return {
+        "stock": random.choice(STOCKS),
+        "price": round(random.uniform(100, 500), 2),
+        "timestamp": time.time(),
+    }
+
+
+def encode_event(data: dict, event_id: Optional[int] = None, event: Optional[str] = None) -> bytes:
+    """Encode the data as a Server-Sent Event frame."""
+    frame = f"data: {json.dumps(data)}\n\n"
+    if event is not None:
+        frame = f"event: {event}\n" + frame
+    if event_id is not None:
+        frame = f"id: {event_id}\n" + frame
+    return frame.encode()
+
+
+def encode_batch(chunks: List[bytes]) -> bytes:
+    """
+    Merge the `data` frames in `chunks` into a single `batch` event, whose data is a JSON array of the individual
+    payloads & whose id is the id of the last frame. Comments & named events (eg - `reset`) are passed through as is.
+    """
+    payloads, passthrough, last_id = [], [], None
+    for chunk in chunks:
+        for frame in chunk.split(b"\n\n"):
+            if not frame:
+                continue
+            lines = frame.split(b"\n")
+            if frame.startswith(b":") or any(line.startswith(b"event:") for line in lines):
+                passthrough.append(frame + b"\n\n")
+                continue
+            for line in lines:
+                if line.startswith(b"id: "):
+                    last_id = line[4:]
+                elif line.startswith(b"data: "):
+                    payloads.append(line[6:])
+
+    batch = b"".join(passthrough)
+    if payloads:
+        if last_id is not None:
+            batch += b"id: " + last_id + b"\n"
+        batch += b"event: batch\ndata: [" + b",".join(payloads) + b"]\n\n"
+    return batch
+
+
+class GzipStream:
+    """
+    Gzip a stream incrementally. Every chunk is flushed with `Z_SYNC_FLUSH`, so the client can decode it right away.
+
+    Every connection has its own compressor, so the window & memory level are kept small to bound the memory per
+    connection (~32 KB instead of ~256 KB with the zlib defaults).
+    """
+
+    def __init__(self, level: int = 6, window_bits: int = 12, mem_level: int = 5):
+        # 16 + window_bits selects the gzip container
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + window_bits, mem_level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    """Whether the `Accept-Encoding` request header allows gzip."""
+    for coding in (accept_encoding or "").split(","):
+        name, _, params = coding.strip().partition(";")
+        if name.strip().lower() == "gzip":
+            return params.replace(" ", "") not in ("q=0", "q=0.0")
+    return False
+
+
+def parse_topics(value: Optional[str], known: Iterable[str] = STOCKS) -> Optional[FrozenSet[str]]:
+    """
+    Parse a comma separated list of topics (eg - `?stocks=AAPL,MSFT`). Returns None (all topics) if it is empty.
+
+    Raises ValueError for topics which are never published, as such a stream would never receive anything.
+    """
+    topics = frozenset(topic.strip().upper() for topic in (value or "").split(",") if topic.strip())
+    unknown = topics.difference(known)
+    if unknown:
+        raise ValueError(f"Unknown topics: {', '.join(sorted(unknown))}")
+    return topics or None
+
+
+def parse_batch_interval(value: Optional[str]) -> Optional[float]:
+    """Parse the flush interval in milliseconds (eg - `?batch=100`) into seconds. Returns None (no batching) if invalid."""
+    try:
+        milliseconds = float(value)
+    except (TypeError, ValueError):
+        return None
+    return milliseconds / 1000 if milliseconds > 0 else None
+
+
+def parse_last_event_id(value: Optional[str]) -> Optional[int]:
+    """Parse the `Last-Event-ID` request header. Returns None if it is missing or invalid."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class Subscriber:
+    def __init__(self, max_queue_size: int = 100):
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.dropped = 0  # events dropped because the subscriber was too slow
+        self.topics: Optional[FrozenSet[str]] = None  # None means all topics
+
+    def offer(self, frame: bytes, topic: Optional[str] = None) -> None:
+        """Queue the frame without blocking. If the queue is full, drop the oldest frame."""
+        while True:
+            try:
+                self.queue.put_nowait(frame)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def offer_many(self, frames: List[Tuple[Optional[str], bytes]]) -> None:
+        """Queue a backlog of (topic, frame) as a single entry, so it doesn't push everything else out of the queue."""
+        self.offer(b"".join(frame for _, frame in frames))
+
+    def get(self, timeout: float = None) -> bytes:
+        return self.queue.get(timeout=timeout)
+
+    def get_batch(self, interval: float, timeout: float = None) -> List[bytes]:
+        """
+        Wait (up to `timeout` seconds, else raise `queue.Empty`) for the next frame & collect every frame arriving
+        within `interval` seconds after it.
+        """
+        frames = [self.get(timeout=timeout)]
+        deadline = time.monotonic() + interval
+        while (remaining := deadline - time.monotonic()) > 0:
+            try:
+                frames.append(self.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return frames
+
+    def drain(self) -> List[bytes]:
+        """All the frames queued right now, without blocking."""
+        frames = []
+        while True:
+            try:
+                frames.append(self.queue.get_nowait())
+            except queue.Empty:
+                return frames
+
+
+class CoalescingSubscriber(Subscriber):
+    """Keeps only the latest undelivered frame per topic. `get` returns all of them together."""
+
+    def __init__(self):
+        super().__init__()
+        self.pending: Dict[Optional[str], bytes] = {}
+        self.condition = threading.Condition()
+
+    def offer(self, frame: bytes, topic: Optional[str] = None) -> None:
+        with self.condition:
+            if self.pending.pop(topic, None) is not None:
+                self.dropped += 1
+            self.pending[topic] = frame
+            self.condition.notify()
+
+    def offer_many(self, frames: List[Tuple[Optional[str], bytes]]) -> None:
+        for topic, frame in frames:
+            self.offer(frame, topic)
+
+    def get(self, timeout: float = None) -> bytes:
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.pending, timeout):
+                raise queue.Empty
+            frames = b"".join(self.pending.values())
+            self.pending.clear()
+            return frames
+
+    def get_batch(self, interval: float, timeout: float = None) -> List[bytes]:
+        # only the latest frame per topic is kept anyway, so the frames can wait in `pending` till the end of the batch
+        frames = [self.get(timeout=timeout)]
+        time.sleep(interval)
+        return frames + self.drain()
+
+    def drain(self) -> List[bytes]:
+        with self.condition:
+            frames = list(self.pending.values())
+            self.pending.clear()
+            return frames
+
+
+class AsyncSubscriber:
+    """Subscriber for asyncio servers. `offer` must be called from the event loop thread."""
+
+    def __init__(self, max_queue_size: int = 100):
+        self.queue = asyncio.Queue(maxsize=max_queue_size)
+        self.dropped = 0
+        self.topics: Optional[FrozenSet[str]] = None
+        self.batch: Optional[List[bytes]] = None  # frames of the batch `get_batch` is collecting
+
+    def offer(self, frame: bytes, topic: Optional[str] = None) -> None:
+        if self.batch is not None:
+            self.batch.append(frame)
+            return
+        while True:
+            try:
+                self.queue.put_nowait(frame)
+                return
+            except asyncio.QueueFull:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except asyncio.QueueEmpty:
+                    pass
+
+    def offer_many(self, frames: List[Tuple[Optional[str], bytes]]) -> None:
+        self.offer(b"".join(frame for _, frame in frames))
+
+    async def get(self) -> bytes:
+        """Wait for the next frame & return it along with any other frames already queued, so they take one write."""
+        frames = [await self.queue.get()]
+        frames.extend(self.drain())
+        return b"".join(frames)
+
+    async def get_batch(self, interval: float) -> List[bytes]:
+        """
+        Wait for the next frame & collect every frame arriving within `interval` seconds after it. Meanwhile, `offer`
+        appends the frames straight to the batch, so the batch isn't limited by the queue & the connection isn't woken
+        up for every frame.
+        """
+        self.batch = [await self.get()]
+        try:
+            await asyncio.sleep(interval)
+            return self.batch
+        finally:
+            self.batch = None
+
+    def drain(self) -> List[bytes]:
+        """All the frames queued right now, without waiting."""
+        frames = []
+        while not self.queue.empty():
+            frames.append(self.queue.get_nowait())
+        return frames
+
+
+class AsyncCoalescingSubscriber(AsyncSubscriber):
+    def __init__(self):
+        super().__init__()
+        self.pending: Dict[Optional[str], bytes] = {}
+        self.has_pending = asyncio.Event()
+
+    def offer(self, frame: bytes, topic: Optional[str] = None) -> None:
+        if self.pending.pop(topic, None) is not None:
+            self.dropped += 1
+        self.pending[topic] = frame
+        self.has_pending.set()
+
+    def offer_many(self, frames: List[Tuple[Optional[str], bytes]]) -> None:
+        for topic, frame in frames:
+            self.offer(frame, topic)
+
+    async def get(self) -> bytes:
+        await self.has_pending.wait()
+        return b"".join(self.drain())
+
+    async def get_batch(self, interval: float) -> List[bytes]:
+        frames = [await self.get()]
+        await asyncio.sleep(interval)
+        return frames + self.drain()
+
+    def drain(self) -> List[bytes]:
+        frames = list(self.pending.values())
+        self.pending.clear()
+        self.has_pending.clear()
+        return frames
+
+
+class Hub:
+    def __init__(self, history_size: int = 1000):
+        self.subscribers: Set[Subscriber] = set()
+        # index from topic to the subscribers interested in it. `all_topics` subscribers receive every topic.
+        self.topic_subscribers: Dict[str, Set[Subscriber]] = {}
+        self.all_topics: Set[Subscriber] = set()
+        self.lock = threading.Lock()
+        self.published = 0
+        self.last_id = 0
+        # ring buffer of (event id, topic, encoded frame) for the most recent events
+        self.history = deque(maxlen=history_size)
+
+    def subscribe(
+        self,
+        subscriber: Subscriber,
+        last_event_id: Optional[int] = None,
+        topics: Optional[Iterable[str]] = None,
+    ) -> Subscriber:
+        subscriber.topics = frozenset(topics) if topics is not None else None
+        # Replay & subscribe under the same lock as `publish` assigns ids, so no event is missed or sent twice
+        with self.lock:
+            if last_event_id is not None:
+                replay = self.replay(last_event_id, subscriber.topics)
+                if replay:
+                    subscriber.offer_many(replay)
+            self.subscribers.add(subscriber)
+            if subscriber.topics is None:
+                self.all_topics.add(subscriber)
+            else:
+                for topic in subscriber.topics:
+                    self.topic_subscribers.setdefault(topic, set()).add(subscriber)
+        return subscriber
+
+    def replay(
+        self, last_event_id: int, topics: Optional[FrozenSet[str]] = None
+    ) -> List[Tuple[Optional[str], bytes]]:
+        """(topic, frame) published after `last_event_id`. Must be called with the lock held."""
+        oldest_id = self.history[0][0] if self.history else self.last_id + 1
+        if not (oldest_id - 1 <= last_event_id <= self.last_id):
+            # The missed events are no longer in the buffer (or the id is from before a server restart)
+            return [(None, encode_event({"last_id": self.last_id}, event_id=self.last_id, event="reset"))]
+        # ids in the buffer are consecutive, so the position of the first missed event can be computed directly
+        start = last_event_id - oldest_id + 1
+        return [
+            (topic, frame)
+            for _, topic, frame in islice(self.history, start, None)
+            if topics is None or topic in topics
+        ]
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        with self.lock:
+            self.subscribers.discard(subscriber)
+            self.all_topics.discard(subscriber)
+            for topic in subscriber.topics or ():
+                subscribers = self.topic_subscribers.get(topic)
+                if subscribers is not None:
+                    subscribers.discard(subscriber)
+                    if not subscribers:
+                        del self.topic_subscribers[topic]
+
+    def publish(self, data: dict, topic: Optional[str] = None) -> None:
+        with self.lock:
+            self.last_id += 1
+            # Serialize once for all the subscribers
+            frame = encode_event(data, event_id=self.last_id)
+            self.history.append((self.last_id, topic, frame))
+            subscribers = list(self.all_topics)
+            subscribers.extend(self.topic_subscribers.get(topic, ()))
+        for subscriber in subscribers:
+            subscriber.offer(frame, topic)
+        self.published += 1
+
+    def broadcast(self, frame: bytes) -> None:
+        """Send an already encoded frame (eg - a heartbeat comment) to all the subscribers. It is not kept in history."""
+        # take a snapshot, so (un)subscribing doesn't wait for the whole fan-out
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            subscriber.offer(frame)
+
+
+class StockPricePublisher(threading.Thread):
+    """Publishes a stock price update to the hub every `interval` seconds."""
+
+    def __init__(self, hub: Hub, interval: float = 1.0):
+        super().__init__(daemon=True)
+        self.hub = hub
+        self.interval = interval
+        self.stop_event = threading.Event()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            data = generate_stock_price()
+            self.hub.publish(data, topic=data["stock"])
+            self.stop_event.wait(self.interval)
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
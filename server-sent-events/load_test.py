@@ -0,0 +1,169 @@
+"""
+Load test for `async_server.py`.
+
+Starts the server in a separate process, opens `--connections` concurrent `/stock-updates` streams from a few client
+processes & reports:
+1. server memory per connection - growth of the server's resident memory (VmRSS) divided by the number of streams
+2. event delivery latency percentiles - time from the publisher creating an update (its `timestamp`) to a client
+   receiving it, over all the clients & all the updates
+
+Linux only (reads `/proc/<pid>/status`). Every client process connects from its own loopback address (127.0.0.2,
+127.0.0.3, ...) so the test isn't limited by the ~28K ephemeral ports of a single source address.
+
+    python load_test.py --connections 50000 --duration 20
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import resource
+import time
+
+from async_server import serve
+
+HOST = "127.0.0.1"
+PORT = 5055
+
+
+def raise_open_files_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return hard
+
+
+def rss_kb(pid: int) -> int:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+def run_server(publish_interval: float):
+    raise_open_files_limit()
+    asyncio.run(serve(HOST, PORT, publish_interval=publish_interval, heartbeat_interval=5))
+
+
+async def stream(local_addr: str, semaphore, latencies: list, connected: asyncio.Event, counter: dict):
+    # open the connections in batches, so the server's accept backlog doesn't overflow
+    async with semaphore:
+        reader, writer = await asyncio.open_connection(HOST, PORT, local_addr=(local_addr, 0))
+        writer.write(f"GET /stock-updates HTTP/1.1\r\nHost: {HOST}\r\n\r\n".encode())
+        await reader.readuntil(b"\r\n\r\n")
+    counter["connected"] += 1
+    if counter["connected"] == counter["total"]:
+        connected.set()
+    try:
+        while True:
+            frame = await reader.readuntil(b"\n\n")
+            received = time.time()
+            for line in frame.split(b"\n"):
+                if line.startswith(b"data: "):
+                    data = json.loads(line[6:])
+                    latencies.append(received - data["timestamp"])
+    finally:
+        writer.close()
+
+
+async def client(index: int, connections: int, ready, start_measuring, duration: float):
+    latencies = []
+    connected = asyncio.Event()
+    counter = {"connected": 0, "total": connections}
+    semaphore = asyncio.Semaphore(500)
+    local_addr = f"127.0.0.{index + 2}"
+
+    tasks = [
+        asyncio.create_task(stream(local_addr, semaphore, latencies, connected, counter))
+        for _ in range(connections)
+    ]
+    await connected.wait()
+    ready.set()
+
+    # only count the updates received while all the streams are open
+    await asyncio.get_running_loop().run_in_executor(None, start_measuring.wait)
+    latencies.clear()
+    await asyncio.sleep(duration)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return latencies
+
+
+def run_client(index, connections, ready, start_measuring, duration, results):
+    raise_open_files_limit()
+    latencies = asyncio.run(client(index, connections, ready, start_measuring, duration))
+    results.put(latencies)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(int(len(values) * p / 100), len(values) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--connections", type=int, default=10_000)
+    parser.add_argument("--clients", type=int, default=min(os.cpu_count() or 1, 8), help="client processes")
+    parser.add_argument("--duration", type=float, default=10, help="seconds to measure delivery latency for")
+    parser.add_argument("--publish-interval", type=float, default=0.1)
+    args = parser.parse_args()
+
+    limit = raise_open_files_limit()
+    if args.connections + 100 > limit:
+        print(f"Open files limit is {limit}, raise it (ulimit -n) to open {args.connections} connections")
+        return
+
+    server = multiprocessing.Process(target=run_server, args=(args.publish_interval,), daemon=True)
+    server.start()
+    time.sleep(1)
+    baseline_rss = rss_kb(server.pid)
+
+    results = multiprocessing.Queue()
+    start_measuring = multiprocessing.Event()
+    per_client = [args.connections // args.clients] * args.clients
+    per_client[0] += args.connections - sum(per_client)
+    readies, clients = [], []
+    connect_start = time.time()
+    for index, connections in enumerate(per_client):
+        ready = multiprocessing.Event()
+        process = multiprocessing.Process(
+            target=run_client, args=(index, connections, ready, start_measuring, args.duration, results)
+        )
+        process.start()
+        readies.append(ready)
+        clients.append(process)
+    for ready in readies:
+        ready.wait()
+    connect_time = time.time() - connect_start
+
+    # let the buffers settle before measuring memory
+    time.sleep(2)
+    connected_rss = rss_kb(server.pid)
+    start_measuring.set()
+
+    latencies = []
+    for _ in clients:
+        latencies.extend(results.get())
+    for process in clients:
+        process.join()
+    server.terminate()
+
+    print(f"Connections: {args.connections} (opened in {connect_time:.1f} sec)")
+    print(
+        f"Server RSS: {baseline_rss / 1024:.1f} MB idle, {connected_rss / 1024:.1f} MB connected, "
+        f"{(connected_rss - baseline_rss) / args.connections:.1f} KB per connection"
+    )
+    if not latencies:
+        print("No events received")
+        return
+    print(
+        f"Events received: {len(latencies)}. Delivery latency: "
+        + ", ".join(f"p{p} {percentile(latencies, p) * 1000:.1f} ms" for p in (50, 90, 99, 99.9))
+        + f", max {max(latencies) * 1000:.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
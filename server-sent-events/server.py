@@ -1,34 +1,96 @@
-from flask import Flask, Response
+from flask import Flask, Response, abort, request
 from flask_cors import CORS
-import json
-import time
-import random
+import queue
+import threading
+from typing import FrozenSet
+
+from hub import (
+    HEARTBEAT,
+    HEARTBEAT_INTERVAL,
+    CoalescingSubscriber,
+    GzipStream,
+    Hub,
+    StockPricePublisher,
+    Subscriber,
+    accepts_gzip,
+    encode_batch,
+    parse_batch_interval,
+    parse_last_event_id,
+    parse_topics,
+)
 
 app = Flask(__name__)
 CORS(app)
 
+# A single publisher generates & encodes every event once, the hub fans it out to all the connected clients.
+hub = Hub()
+publisher = None
+publisher_lock = threading.Lock()
+
+
+def start_publisher():
+    """Start the publisher on the first connection."""
+    global publisher
+    with publisher_lock:
+        if publisher is None:
+            publisher = StockPricePublisher(hub, interval=1)
+            publisher.start()
 
-def generate_stock_prices():
-    """Simulate real-time stock price updates."""
-    stocks = ["AAPL", "MSFT", "GOOG", "AMZN"]
-    while True:
-        data = {
-            "stock": random.choice(stocks),
-            "price": round(random.uniform(100, 500), 2),
-        }
-        # Yield the data as a Server-Sent Event.
-        yield f"data: {json.dumps(data)}\n\n"
-        # Update every 1 second
-        time.sleep(1)
+
+def stream_events(
+    subscriber: Subscriber,
+    last_event_id: int = None,
+    topics: FrozenSet[str] = None,
+    batch_interval: float = None,
+    gzip: GzipStream = None,
+):
+    """
+    Subscribe the client & yield the pre-encoded events queued for it. If nothing was queued for `HEARTBEAT_INTERVAL`
+    seconds, a heartbeat is sent instead - writing is the only way to find out that the client went away.
+    """
+    try:
+        # subscribed only once the response is being streamed - a generator which is never started can't unsubscribe
+        hub.subscribe(subscriber, last_event_id, topics)
+        while True:
+            try:
+                if batch_interval is not None:
+                    chunk = encode_batch(subscriber.get_batch(batch_interval, timeout=HEARTBEAT_INTERVAL))
+                else:
+                    chunk = subscriber.get(timeout=HEARTBEAT_INTERVAL)
+            except queue.Empty:
+                chunk = HEARTBEAT
+            yield gzip.compress(chunk) if gzip is not None else chunk
+    finally:
+        # client disconnected
+        hub.unsubscribe(subscriber)
 
 
 @app.route("/stock-updates")
 def stock_updates():
     """Endpoint for Server-Sent Events."""
+    start_publisher()
+    # ?stocks=AAPL,MSFT subscribes to just those symbols, ?coalesce=1 sends only the latest price per symbol
+    try:
+        topics = parse_topics(request.args.get("stocks"))
+    except ValueError as e:
+        abort(400, str(e))
+    coalesce = request.args.get("coalesce") == "1"
+    # ?batch=100 sends the updates of every 100 ms as a single event
+    batch_interval = parse_batch_interval(request.args.get("batch"))
+    # EventSource sends the id of the last event it received when it reconnects
+    last_event_id = parse_last_event_id(request.headers.get("Last-Event-ID"))
+    subscriber = CoalescingSubscriber() if coalesce else Subscriber(max_queue_size=100)
+
+    gzip = GzipStream() if accepts_gzip(request.headers.get("Accept-Encoding")) else None
+    headers = {"Content-Encoding": "gzip", "Vary": "Accept-Encoding"} if gzip is not None else {}
 
     # Set the response type to text/event-stream.
-    return Response(generate_stock_prices(), content_type="text/event-stream")
+    return Response(
+        stream_events(subscriber, last_event_id, topics, batch_interval, gzip),
+        content_type="text/event-stream",
+        headers=headers,
+    )
 
 
 if __name__ == "__main__":
-    app.run(debug=True)
+    app.run(debug=True, threaded=True)